@@ -0,0 +1,13 @@
+import uvicorn
+
+from app.settings import settings
+
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "app.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=settings.worker_count,
+        proxy_headers=True,
+    )
@@ -0,0 +1,197 @@
+import asyncio
+import inspect
+import logging
+import uuid
+from typing import Any, Callable, Hashable
+
+import asyncpg
+from pydantic_core import from_json, to_json
+
+from app.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_KEY = 0x6175_6469_6f00
+
+
+class InvalidationBus:
+    def __init__(
+        self,
+        channel: str,
+        reconnect_interval: float,
+        heartbeat_interval: float,
+        heartbeat_timeout: float,
+    ) -> None:
+        self.channel = channel
+        self.reconnect_interval = reconnect_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.worker_id = uuid.uuid4().hex
+        self.is_leader = True
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+        self.leadership_listeners: list[Callable[[bool], None]] = []
+        self._handlers: dict[str, Callable[[Any], None]] = {}
+        self._resets: list[Callable[[], Any]] = []
+        self._queue: asyncio.Queue | None = None
+        self._connection: asyncpg.Connection | None = None
+        self._closed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def register(self, name: str, handler: Callable[[Any], None], reset: Callable[[], Any] | None = None) -> None:
+        self._handlers[name] = handler
+        if reset is not None:
+            self._resets.append(reset)
+
+    def register_cache(self, name: str, cache) -> None:
+        cache.listeners.append(lambda key: self.publish(name, key))
+        self.register(name, cache.discard, cache.clear)
+
+    def publish(self, name: str, key: Hashable) -> None:
+        if self._queue is not None:
+            self._queue.put_nowait((name, key))
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = from_json(payload)
+            if message["worker"] == self.worker_id:
+                return
+            key = message["key"]
+            handler = self._handlers.get(message["name"])
+            if handler is not None:
+                handler(tuple(key) if isinstance(key, list) else key)
+                self.received += 1
+        except Exception:
+            logger.exception("Не удалось применить сообщение шины инвалидации")
+
+    async def _reset(self) -> None:
+        # Пока соединения не было, сообщения могли потеряться, поэтому кэши сбрасываются целиком.
+        for reset in self._resets:
+            try:
+                if inspect.isawaitable(result := reset()):
+                    await result
+            except Exception:
+                logger.exception("Не удалось сбросить состояние после переподключения шины")
+
+    def _set_leader(self, is_leader: bool) -> None:
+        changed = is_leader != self.is_leader
+        self.is_leader = is_leader
+        if changed:
+            for listener in self.leadership_listeners:
+                listener(is_leader)
+
+    async def _connect(self) -> None:
+        connection = await asyncpg.connect(
+            host=settings.postgresql.host,
+            port=int(settings.postgresql.port),
+            user=settings.postgresql.user,
+            password=settings.postgresql.password,
+            database=settings.postgresql.dbname,
+        )
+        try:
+            self._closed.clear()
+            connection.add_termination_listener(lambda _: self._closed.set())
+            await connection.add_listener(self.channel, self._on_notify)
+            is_leader = await connection.fetchval("SELECT pg_try_advisory_lock($1)", LEADER_LOCK_KEY)
+        except BaseException:
+            await connection.close()
+            raise
+        self._connection = connection
+        self._set_leader(is_leader)
+
+    async def _disconnect(self) -> None:
+        connection, self._connection = self._connection, None
+        self._set_leader(False)
+        if connection is not None and not connection.is_closed():
+            try:
+                await connection.close(timeout=5)
+            except Exception:
+                connection.terminate()
+
+    async def _publish_until_closed(self) -> None:
+        closed = asyncio.create_task(self._closed.wait())
+        try:
+            while True:
+                get = asyncio.create_task(self._queue.get())
+                done, _ = await asyncio.wait(
+                    {get, closed}, timeout=self.heartbeat_interval, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not get.done():
+                    get.cancel()
+                    if closed in done:
+                        raise ConnectionError("Соединение шины инвалидации закрыто")
+                    await self._heartbeat()
+                    continue
+                name, key = get.result()
+                payload = to_json({"worker": self.worker_id, "name": name, "key": key}).decode()
+                try:
+                    await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                except BaseException:
+                    self._queue.put_nowait((name, key))
+                    raise
+                self.published += 1
+        finally:
+            closed.cancel()
+
+    async def _heartbeat(self) -> None:
+        # Полуоткрытое соединение само не закрывается, поэтому его проверяет запрос с таймаутом.
+        # Заодно воркер без лидерства пробует его перехватить, если лидер отключился.
+        if self.is_leader:
+            await self._connection.fetchval("SELECT 1", timeout=self.heartbeat_timeout)
+        else:
+            self._set_leader(await self._connection.fetchval(
+                "SELECT pg_try_advisory_lock($1)", LEADER_LOCK_KEY, timeout=self.heartbeat_timeout
+            ))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self._connection is None:
+                    await asyncio.sleep(self.reconnect_interval)
+                    await self._connect()
+                    self.reconnects += 1
+                    await self._reset()
+                await self._publish_until_closed()
+            except Exception:
+                logger.exception("Ошибка соединения шины инвалидации")
+            await self._disconnect()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self.is_leader = False
+            self._queue = asyncio.Queue()
+            try:
+                await self._connect()
+            except Exception:
+                logger.exception("Не удалось подключить шину инвалидации")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._queue = None
+            await self._disconnect()
+
+    def stats(self) -> dict:
+        return {
+            "connected": int(self._connection is not None and not self._connection.is_closed()),
+            "leader": int(self.is_leader),
+            "published": self.published,
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+invalidation_bus = InvalidationBus(
+    settings.invalidation_channel,
+    settings.invalidation_reconnect_interval,
+    settings.invalidation_heartbeat_interval,
+    settings.invalidation_heartbeat_timeout,
+)
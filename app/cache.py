@@ -0,0 +1,243 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, NamedTuple, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.listeners: list[Callable[[K], None]] = []
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: dict[K, list] = {}
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _peek(self, key: K) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= time.monotonic():
+                return None
+            return item[1]
+
+    def get_or_compute(self, key: K, compute: Callable[[], tuple[V, float | None]]) -> V:
+        if (value := self.get(key)) is not None:
+            return value
+
+        with self._lock:
+            inflight = self._inflight.setdefault(key, [threading.Lock(), 0])
+            inflight[1] += 1
+        try:
+            with inflight[0]:
+                if (value := self._peek(key)) is not None:
+                    with self._lock:
+                        self.collapsed += 1
+                    return value
+                value, ttl = compute()
+                if ttl is None or ttl > 0:
+                    self.set(key, value, ttl)
+                return value
+        finally:
+            with self._lock:
+                inflight[1] -= 1
+                if not inflight[1]:
+                    del self._inflight[key]
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, key: K) -> None:
+        self.discard(key)
+        for listener in self.listeners:
+            listener(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+HALVE = bytes(value >> 1 for value in range(256))
+
+
+# Count-min sketch с насыщающимися счетчиками и старением, как в TinyLFU.
+class FrequencySketch:
+    def __init__(self, width: int, depth: int = 4) -> None:
+        self.width = max(16, width)
+        self.depth = depth
+        self.sample_size = 10 * self.width
+        self.additions = 0
+        self._rows = [bytearray(self.width) for _ in range(depth)]
+
+    def _indexes(self, key: Hashable) -> list[int]:
+        first = hash(key)
+        second = hash((key, self.width)) | 1
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def increment(self, key: Hashable) -> None:
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < 15:
+                row[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._rows = [row.translate(HALVE) for row in self._rows]
+            self.additions //= 2
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+
+class CachedFile(NamedTuple):
+    data: bytes
+    mtime: float
+
+
+class HotFileCache(Generic[K]):
+    def __init__(self, max_bytes: int, max_item_size: int, sketch_width: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_size = max_item_size
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.collapsed = 0
+        self.sketch = FrequencySketch(sketch_width)
+        self._data: OrderedDict[K, CachedFile] = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: dict[K, list] = {}
+
+    def get(self, key: K) -> CachedFile | None:
+        with self._lock:
+            self.sketch.increment(key)
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def should_admit(self, key: K, size: int) -> bool:
+        if size > self.max_item_size or size > self.max_bytes:
+            return False
+        with self._lock:
+            free = self.max_bytes - self.size_bytes
+            if free >= size:
+                return True
+            # Кандидат вытесняет только реже запрашиваемые файлы, поэтому разовые
+            # скачивания не вымывают популярные.
+            frequency = self.sketch.estimate(key)
+            for victim_key, victim in self._data.items():
+                if free >= size:
+                    break
+                if self.sketch.estimate(victim_key) >= frequency:
+                    self.rejected += 1
+                    return False
+                free += len(victim.data)
+            return True
+
+    async def get_or_load(self, key: K, load: Callable[[], Awaitable[CachedFile | None]]) -> CachedFile | None:
+        with self._lock:
+            inflight = self._inflight.setdefault(key, [asyncio.Lock(), 0])
+            inflight[1] += 1
+        try:
+            async with inflight[0]:
+                with self._lock:
+                    item = self._data.get(key)
+                    if item is not None:
+                        self.collapsed += 1
+                        return item
+                item = await load()
+                if item is not None:
+                    self.put(key, item)
+                return item
+        finally:
+            with self._lock:
+                inflight[1] -= 1
+                if not inflight[1]:
+                    del self._inflight[key]
+
+    def put(self, key: K, item: CachedFile) -> None:
+        with self._lock:
+            if (previous := self._data.pop(key, None)) is not None:
+                self.size_bytes -= len(previous.data)
+            while self._data and self.size_bytes + len(item.data) > self.max_bytes:
+                _, victim = self._data.popitem(last=False)
+                self.size_bytes -= len(victim.data)
+                self.evicted += 1
+            self._data[key] = item
+            self.size_bytes += len(item.data)
+            self.admitted += 1
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            if (item := self._data.pop(key, None)) is not None:
+                self.size_bytes -= len(item.data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "collapsed": self.collapsed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,12 +1,87 @@
+import time
+from importlib.util import find_spec
 from typing import Annotated
 
-from fastapi import Depends
-from httpx import AsyncClient
+from fastapi import Depends, Request
+from httpx import AsyncClient, AsyncHTTPTransport, Limits, Timeout
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from app.metrics import db_statement_duration_seconds, db_statement_rows_total
 from app.settings import settings
 
-engine = create_async_engine(url=settings.postgresql.get_conninfo())
+class PoolStats:
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.waiting = 0
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def connect(self):
+        pool_stats.waiting += 1
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.waiting -= 1
+            waited = time.perf_counter() - started
+            pool_stats.wait_seconds_total += waited
+            pool_stats.wait_seconds_max = max(pool_stats.wait_seconds_max, waited)
+        pool_stats.checkouts += 1
+        return connection
+
+
+def get_pool_status() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.postgresql.max_overflow,
+        "waiting": pool_stats.waiting,
+        "checkouts": pool_stats.checkouts,
+        "timeouts": pool_stats.timeouts,
+        "wait_seconds_total": pool_stats.wait_seconds_total,
+        "wait_seconds_max": pool_stats.wait_seconds_max,
+    }
+
+
+engine = create_async_engine(
+    url=settings.postgresql.get_conninfo(),
+    poolclass=InstrumentedPool,
+    pool_size=settings.postgresql.pool_size,
+    max_overflow=settings.postgresql.max_overflow,
+    pool_timeout=settings.postgresql.pool_timeout,
+    pool_recycle=settings.postgresql.pool_recycle,
+    pool_pre_ping=settings.postgresql.pool_pre_ping,
+    connect_args={"prepared_statement_cache_size": settings.postgresql.statement_cache_size},
+)
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_started"] = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("statement_started", None)
+    if started is None:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper()
+    db_statement_duration_seconds.observe(time.perf_counter() - started, verb)
+    if cursor.rowcount > 0:
+        db_statement_rows_total.inc(verb, amount=cursor.rowcount)
 
 new_session = async_sessionmaker(bind=engine, expire_on_commit=False)
 
@@ -14,9 +89,42 @@ async def get_session():
     async with new_session() as session:
         yield session
 
-async def get_http_client():
-    async with AsyncClient() as client:
-        yield client
+def create_http_client() -> AsyncClient:
+    config = settings.http_client
+    http2 = config.http2 and find_spec("h2") is not None
+
+    def host_transport() -> AsyncHTTPTransport:
+        return AsyncHTTPTransport(
+            limits=Limits(
+                max_connections=config.per_host_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            http2=http2,
+            retries=config.retries,
+        )
+
+    return AsyncClient(
+        timeout=Timeout(
+            connect=config.connect_timeout,
+            read=config.read_timeout,
+            write=config.write_timeout,
+            pool=config.pool_timeout,
+        ),
+        limits=Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        http2=http2,
+        mounts={
+            settings.yandex.oauth_url: host_transport(),
+            settings.yandex.login_url: host_transport(),
+        },
+    )
+
+def get_http_client(request: Request) -> AsyncClient:
+    return request.app.state.http_client
 
 http_client_dep = Annotated[AsyncClient, Depends(get_http_client)]
 session_dep = Annotated[AsyncSession, Depends(get_session)]
\ No newline at end of file
@@ -1,20 +1,74 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from starlette.middleware.sessions import SessionMiddleware
 
+from app.bus import invalidation_bus
+from app.deps import create_http_client
+from app.metrics import MetricsMiddleware
+from app.ratelimit import RateLimitMiddleware, limiter
 from app.settings import settings
+from app.storage import storage
 from app.routers.auth.auth import router as auth_router
+from app.routers.auth.passwords import password_pool
+from app.routers.auth.revocation import revocation_index
+from app.routers.auth.services import user_cache
 from app.routers.users.users import router as users_router
 from app.routers.audio.audio import router as audio_router
+from app.routers.audio.processing import audio_processor
+from app.routers.audio.services import ownership_cache
+from app.routers.audio.uploads import upload_collector, upload_finalizer
 from app.routers.admin.admin import router as admin_router
+from app.routers.admin.reaper import blob_reaper
+from app.routers.internal.internal import router as internal_router
+
+
+logger = logging.getLogger(__name__)
+
+if settings.invalidation_bus_enabled:
+    invalidation_bus.register_cache("user", user_cache)
+    invalidation_bus.register_cache("ownership", ownership_cache)
+    invalidation_bus.register("revoked_token", revocation_index.add, revocation_index.rebuild)
+    revocation_index.listeners.append(lambda jti: invalidation_bus.publish("revoked_token", jti))
+    invalidation_bus.leadership_listeners.append(audio_processor.set_sweeping)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await storage.prepare()
+    app.state.http_client = create_http_client()
+    if settings.invalidation_bus_enabled:
+        await invalidation_bus.start()
+        if settings.ratelimit.enabled and settings.ratelimit.store == "memory":
+            logger.warning("Лимиты запросов считаются в каждом воркере отдельно, используйте RATELIMIT_STORE=postgres")
+    blob_reaper.start()
+    upload_collector.start()
+    upload_finalizer.start()
+    await revocation_index.start()
+    audio_processor.set_sweeping(invalidation_bus.is_leader)
+    audio_processor.start()
+    yield
+    await audio_processor.stop()
+    await upload_finalizer.stop()
+    await upload_collector.stop()
+    await revocation_index.stop()
+    await blob_reaper.stop()
+    await invalidation_bus.stop()
+    await app.state.http_client.aclose()
+    password_pool.shutdown()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     SessionMiddleware,
     secret_key=settings.secret_key
 )
+if settings.ratelimit.enabled:
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(admin_router)
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(audio_router)
+app.include_router(internal_router)
@@ -0,0 +1,233 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from fastapi import Depends
+from jose import JWTError
+from sqlalchemy import Boolean, Float, String, case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Mapped, mapped_column
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.db import Base
+from app.deps import new_session
+from app.metrics import Counter
+from app.routers.auth.services import decode_token
+from app.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+rate_limited_total = Counter(
+    "rate_limited_total", "Запросы, отклоненные ограничителем", ("route_class", "reason"),
+)
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)
+    allowed: Mapped[bool] = mapped_column(Boolean, nullable=False)
+
+
+class BucketLimit(NamedTuple):
+    rate: float
+    burst: float
+
+
+class MemoryRateLimitStore:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, limit: BucketLimit, cost: float, now: float) -> float:
+        tokens, updated_at = self._buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / limit.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class PostgresRateLimitStore:
+    async def take(self, key: str, limit: BucketLimit, cost: float, now: float) -> float:
+        refill = func.least(
+            limit.burst, RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * limit.rate
+        )
+        query = insert(RateLimitBucket).values(
+            key=key, tokens=limit.burst - cost, updated_at=now, allowed=True,
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[RateLimitBucket.key],
+            set_={
+                "tokens": case((refill >= cost, refill - cost), else_=refill),
+                "updated_at": now,
+                "allowed": refill >= cost,
+            },
+        ).returning(RateLimitBucket.tokens, RateLimitBucket.allowed)
+        async with new_session() as session:
+            tokens, allowed = (await session.execute(query)).one()
+            await session.commit()
+        return 0.0 if allowed else (cost - tokens) / limit.rate
+
+
+class RouteClass:
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: int,
+        requests: BucketLimit,
+        bytes_: BucketLimit | None = None,
+    ) -> None:
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.requests = requests
+        self.bytes = bytes_
+        self.in_flight = 0
+
+
+class RateLimiter:
+    def __init__(self, store, route_classes: list[RouteClass]) -> None:
+        self.store = store
+        self.route_classes = {route_class.name: route_class for route_class in route_classes}
+
+    async def _take(self, key: str, limit: BucketLimit, cost: float, now: float) -> float:
+        try:
+            return await self.store.take(key, limit, min(cost, limit.burst), now)
+        except Exception:
+            logger.exception("Не удалось проверить лимит запросов")
+            return 0.0
+
+    async def check(self, route_class: RouteClass, identity: str, size: int) -> float:
+        now = time.time()
+        key = f"{route_class.name}:{identity}"
+        retry_after = await self._take(key, route_class.requests, 1, now)
+        if not retry_after and route_class.bytes is not None and size:
+            retry_after = await self._take(f"{key}:bytes", route_class.bytes, size, now)
+        return retry_after
+
+
+class RateLimited:
+    def __init__(self, route_class: str) -> None:
+        self.route_class = route_class
+
+    def __call__(self) -> None:
+        return None
+
+
+def rate_limited(route_class: str):
+    return Depends(RateLimited(route_class))
+
+def _too_many_requests(retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Слишком много запросов, повторите позже"},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+def _length_required() -> JSONResponse:
+    return JSONResponse({"detail": "Нужен заголовок Content-Length"}, status_code=411)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, limiter: RateLimiter) -> None:
+        self.app = app
+        self.limiter = limiter
+        self._routes: list[tuple] | None = None
+
+    def _route_class(self, scope: Scope) -> tuple | None:
+        if self._routes is None:
+            self._routes = [
+                (route, self.limiter.route_classes[depends.dependency.route_class])
+                for route in scope["app"].routes
+                for depends in getattr(route, "dependencies", ())
+                if isinstance(depends.dependency, RateLimited)
+            ]
+        for route, route_class in self._routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route, route_class
+        return None
+
+    @staticmethod
+    def _identity(headers: Headers, scope: Scope) -> str:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                return f"user:{decode_token(token)['id']}"
+            except (JWTError, KeyError):
+                pass
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (matched := self._route_class(scope)) is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Роутер до отклоненного запроса не доходит, поэтому маршрут для
+        # метрик проставляется здесь.
+        route, route_class = matched
+        if route_class.in_flight >= route_class.max_in_flight:
+            scope["route"] = route
+            rate_limited_total.inc(route_class.name, "in_flight")
+            await _too_many_requests(1)(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if route_class.bytes is not None and "content-length" not in headers:
+            # Без Content-Length объем тела заранее неизвестен и лимит по байтам не посчитать.
+            scope["route"] = route
+            rate_limited_total.inc(route_class.name, "length_required")
+            await _length_required()(scope, receive, send)
+            return
+
+        size = int(headers.get("content-length") or 0)
+        retry_after = await self.limiter.check(route_class, self._identity(headers, scope), size)
+        if retry_after:
+            scope["route"] = route
+            rate_limited_total.inc(route_class.name, "rate")
+            await _too_many_requests(retry_after)(scope, receive, send)
+            return
+
+        route_class.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.in_flight -= 1
+
+
+limiter = RateLimiter(
+    PostgresRateLimitStore() if settings.ratelimit.store == "postgres"
+    else MemoryRateLimitStore(settings.ratelimit.store_size),
+    [
+        RouteClass(
+            "upload",
+            settings.ratelimit.upload_in_flight,
+            BucketLimit(settings.ratelimit.upload_rate, settings.ratelimit.upload_burst),
+            BucketLimit(settings.ratelimit.upload_bytes_rate, settings.ratelimit.upload_bytes_burst),
+        ),
+        RouteClass(
+            "login",
+            settings.ratelimit.login_in_flight,
+            BucketLimit(settings.ratelimit.login_rate, settings.ratelimit.login_burst),
+        ),
+        RouteClass(
+            "download",
+            settings.ratelimit.download_in_flight,
+            BucketLimit(settings.ratelimit.download_rate, settings.ratelimit.download_burst),
+        ),
+    ],
+)
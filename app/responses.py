@@ -0,0 +1,21 @@
+from typing import Any, Iterable
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+from starlette.responses import JSONResponse, Response
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> JSONBytesResponse:
+    return JSONBytesResponse(model.model_dump_json(), status_code=status_code)
+
+def rows_response(rows: Iterable, headers: dict | None = None) -> JSONBytesResponse:
+    return JSONBytesResponse(to_json([row._asdict() for row in rows]), headers=headers)
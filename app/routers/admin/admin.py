@@ -1,11 +1,14 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import JSONResponse
 
 from app.db import Base
 from app.deps import engine, session_dep
-from app.routers.admin.services import delete_user_by_id, make_user_admin
+from app.routers.admin.reaper import blob_reaper
+from app.routers.admin.schemas import UserQuota, UsersDelete, UsersDeleted
+from app.routers.admin.services import delete_user_by_id, delete_users_by_ids, make_user_admin, set_user_quota
 from app.routers.auth.models import User
+from app.routers.auth.services import revoke_user_tokens
 from app.utils import get_current_auth_user, get_current_auth_admin
 
 router = APIRouter(
@@ -48,4 +51,72 @@ async def delete_user(
     admin: Annotated[User, Depends(get_current_auth_admin)]
 ):
     await delete_user_by_id(session, user_id)
-    return {"message": f"Пользователь с id {user_id} удален"}
\ No newline at end of file
+    return {"message": f"Пользователь с id {user_id} удален"}
+
+@router.post(
+    "/revoke_sessions/{user_id}",
+    summary="Завершение всех сессий пользователя",
+    description=(
+        "Для использования нужно иметь права админа\n"
+        "Отзываются все выпущенные пользователю access и refresh токены"
+    )
+)
+async def revoke_sessions(
+    user_id: int,
+    session: session_dep,
+    admin: Annotated[User, Depends(get_current_auth_admin)]
+):
+    if not await revoke_user_tokens(session, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден"
+        )
+    return {"message": f"Сессии пользователя с id {user_id} завершены"}
+
+@router.post(
+    "/set_quota/{user_id}",
+    summary="Квота хранилища пользователя",
+    description=(
+        "Для использования нужно иметь права админа\n"
+        "quota_bytes: null возвращает квоту по умолчанию"
+    )
+)
+async def set_quota(
+    user_id: int,
+    quota: UserQuota,
+    session: session_dep,
+    admin: Annotated[User, Depends(get_current_auth_admin)]
+):
+    if not await set_user_quota(session, user_id, quota.quota_bytes):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден"
+        )
+    return {"message": f"Квота пользователя с id {user_id} обновлена"}
+
+@router.post(
+    "/delete_users",
+    summary="Удаление нескольких пользователей из базы",
+    description=(
+        "Для использования нужно иметь права админа\n"
+        "Файлы пользователей удаляются в фоне, прогресс можно посмотреть в /admin/reaper"
+    ),
+    response_model=UsersDeleted
+)
+async def delete_users(
+    users: UsersDelete,
+    session: session_dep,
+    admin: Annotated[User, Depends(get_current_auth_admin)]
+):
+    deleted = await delete_users_by_ids(session, users.user_ids)
+    return UsersDeleted(deleted=deleted)
+
+@router.get(
+    "/reaper",
+    summary="Прогресс фонового удаления файлов",
+    description="Для использования нужно иметь права админа"
+)
+async def reaper_status(
+    admin: Annotated[User, Depends(get_current_auth_admin)]
+):
+    return await blob_reaper.status()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from datetime import UTC, datetime
+
+from sqlalchemy import delete, func, select, update
+
+from app.deps import new_session
+from app.routers.audio.models import Blob
+from app.routers.audio.processing import PEAKS_SUFFIX, peaks_key
+from app.settings import settings
+from app.storage import storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class BlobReaper:
+    def __init__(self, batch_size: int, interval: float, max_attempts: int) -> None:
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.deleted = 0
+        self.failed = 0
+        self.last_run_at: datetime | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> int:
+        async with new_session() as session:
+            query = (
+                select(Blob.checksum)
+                .where(Blob.ref_count <= 0, Blob.delete_attempts < self.max_attempts)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            result = await session.execute(query)
+            checksums = result.scalars().all()
+            if not checksums:
+                return 0
+
+            keys = [*checksums, *(peaks_key(checksum) for checksum in checksums)]
+            failed_set = {key.removesuffix(PEAKS_SUFFIX) for key in await storage.delete_many(keys)}
+            failed = list(failed_set)
+            deleted = [checksum for checksum in checksums if checksum not in failed_set]
+            if deleted:
+                query = delete(Blob).where(Blob.checksum.in_(deleted), Blob.ref_count <= 0)
+                await session.execute(query)
+            if failed:
+                query = (
+                    update(Blob)
+                    .where(Blob.checksum.in_(failed))
+                    .values(delete_attempts=Blob.delete_attempts + 1)
+                )
+                await session.execute(query)
+            await session.commit()
+
+        self.deleted += len(deleted)
+        self.failed += len(failed)
+        self.last_run_at = datetime.now(UTC)
+        return len(checksums)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception:
+                logger.exception("Не удалось удалить файлы без ссылок")
+                processed = 0
+            if processed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.interval)
+                except TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def status(self) -> dict:
+        async with new_session() as session:
+            query = select(
+                func.count().filter(Blob.delete_attempts < self.max_attempts),
+                func.count().filter(Blob.delete_attempts >= self.max_attempts),
+            ).where(Blob.ref_count <= 0)
+            pending, stuck = (await session.execute(query)).one()
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "pending": pending,
+            "stuck": stuck,
+            "deleted": self.deleted,
+            "failed_attempts": self.failed,
+            "last_run_at": self.last_run_at,
+        }
+
+
+blob_reaper = BlobReaper(
+    settings.reaper_batch_size,
+    settings.reaper_interval,
+    settings.reaper_max_attempts,
+)
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+from collections import Counter
+from itertools import islice
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.deps import engine, new_session
+from app.routers.audio.models import AudioFile, Blob
+from app.routers.audio.processing import PEAKS_SUFFIX
+from app.routers.audio.services import refund_storage, release_blobs
+from app.settings import settings
+from app.storage import storage
+
+
+CHECKSUM_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class Reconciler:
+    def __init__(
+        self,
+        repair: bool,
+        batch_size: int,
+        workers: int,
+        grace_period: float,
+        recheck_delay: float,
+        verbose: bool,
+    ) -> None:
+        self.repair = repair
+        self.batch_size = batch_size
+        self.workers = workers
+        self.grace_period = grace_period
+        self.recheck_delay = recheck_delay
+        self.verbose = verbose
+        self.stats: Counter[str] = Counter()
+        self._suspects: list[str] = []
+        self._suspected_at = 0.0
+
+    def _report(self, kind: str, items: list[str]) -> None:
+        self.stats[kind] += len(items)
+        if self.verbose:
+            for item in items:
+                print(f"{kind}\t{item}")
+
+    @staticmethod
+    def _missing(keys: list[str]) -> list[str]:
+        return [key for key in keys if not os.path.exists(storage.local_path(key))]
+
+    async def _find_missing(self, keys: list[str]) -> list[str]:
+        step = -(-len(keys) // self.workers)
+        parts = await asyncio.gather(*(
+            run_in_threadpool(self._missing, keys[offset:offset + step])
+            for offset in range(0, len(keys), step)
+        ))
+        return [key for part in parts for key in part]
+
+    async def check_database(self) -> None:
+        query = (
+            select(Blob.checksum, Blob.ref_count, func.count(AudioFile.id).label("files"))
+            .outerjoin(AudioFile, AudioFile.checksum == Blob.checksum)
+            .group_by(Blob.checksum)
+            .execution_options(yield_per=self.batch_size)
+        )
+        async with new_session() as session:
+            result = await session.stream(query)
+            async for rows in result.partitions():
+                await self._check_blobs(rows)
+        await self._flush_suspects()
+
+    async def _check_blobs(self, rows) -> None:
+        self.stats["blobs"] += len(rows)
+        referenced = [row.checksum for row in rows if row.files > 0 or row.ref_count > 0]
+        missing = set(await self._find_missing(referenced)) if referenced else set()
+        if missing:
+            if not self._suspects:
+                self._suspected_at = time.monotonic()
+            self._suspects.extend(missing)
+        mismatched = [
+            row.checksum
+            for row in rows
+            if row.checksum not in missing
+            and row.ref_count != row.files
+            and (row.files > 0 or row.ref_count > 0)
+        ]
+        if mismatched:
+            self._report("ref_count_mismatch", mismatched)
+            if self.repair:
+                await self._fix_ref_counts(mismatched)
+        if len(self._suspects) >= self.batch_size:
+            await self._flush_suspects()
+
+    async def _flush_suspects(self) -> None:
+        # Файл пишется в хранилище уже после коммита строки, поэтому перед
+        # тем как считать его потерянным, даем загрузке время завершиться.
+        if not self._suspects:
+            return
+        await asyncio.sleep(max(0.0, self._suspected_at + self.recheck_delay - time.monotonic()))
+        missing = await self._find_missing(self._suspects)
+        self._suspects = []
+        if missing:
+            self._report("missing_file", missing)
+            if self.repair:
+                await self._drop_missing(missing)
+
+    @staticmethod
+    async def _lock_blobs(session, checksums: list[str]) -> list[str]:
+        # Загрузка меняет ref_count под той же блокировкой строки, поэтому пока
+        # строки заблокированы, счетчики и файлы не меняются у нас под ногами.
+        query = (
+            select(Blob.checksum)
+            .where(Blob.checksum.in_(checksums))
+            .order_by(Blob.checksum)
+            .with_for_update()
+        )
+        return list((await session.execute(query)).scalars())
+
+    async def _fix_ref_counts(self, checksums: list[str]) -> None:
+        files = select(func.count()).where(AudioFile.checksum == Blob.checksum).scalar_subquery()
+        async with new_session() as session:
+            locked = await self._lock_blobs(session, checksums)
+            await session.execute(update(Blob).where(Blob.checksum.in_(locked)).values(ref_count=files))
+            await session.commit()
+        self.stats["ref_count_fixed"] += len(locked)
+
+    async def _drop_missing(self, checksums: list[str]) -> None:
+        async with new_session() as session:
+            missing = await self._find_missing(await self._lock_blobs(session, checksums))
+            if not missing:
+                return
+            query = (
+                delete(AudioFile)
+                .where(AudioFile.checksum.in_(missing))
+                .returning(AudioFile.user_id, AudioFile.size_bytes, AudioFile.checksum)
+            )
+            refunds: Counter[int] = Counter()
+            dropped = []
+            for user_id, size, checksum in (await session.execute(query)).all():
+                refunds[user_id] += size
+                dropped.append(checksum)
+            for user_id, size in refunds.items():
+                await refund_storage(session, user_id, size)
+            await release_blobs(session, dropped)
+            await session.commit()
+        self.stats["files_dropped"] += len(dropped)
+
+    async def check_storage(self) -> None:
+        dirs = iter([
+            (str(settings.audio_temp_path), True),
+            *((path, False) for path in await run_in_threadpool(storage.scan_dirs)),
+        ])
+        await asyncio.gather(*(self._scan(dirs) for _ in range(self.workers)))
+
+    async def _scan(self, dirs) -> None:
+        for path, temporary in dirs:
+            try:
+                entries = await run_in_threadpool(os.scandir, path)
+            except FileNotFoundError:
+                continue
+            with entries:
+                while batch := await run_in_threadpool(self._take_files, entries, self.batch_size):
+                    await self._check_files(batch, temporary)
+
+    @staticmethod
+    def _take_files(entries, size: int) -> list[tuple[str, str]]:
+        files = (entry for entry in entries if entry.is_file(follow_symlinks=False))
+        return [(entry.name, entry.path) for entry in islice(files, size)]
+
+    @staticmethod
+    def _stale(paths: list[str], deadline: float) -> list[str]:
+        stale = []
+        for path in paths:
+            try:
+                if os.lstat(path).st_mtime < deadline:
+                    stale.append(path)
+            except FileNotFoundError:
+                pass
+        return stale
+
+    @staticmethod
+    def _remove(paths: list[str]) -> int:
+        removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @staticmethod
+    def _reapable(path: str, key: str | None) -> bool:
+        return (
+            key is not None
+            and CHECKSUM_PATTERN.fullmatch(key.removesuffix(PEAKS_SUFFIX)) is not None
+            and storage.local_path(key) == path
+        )
+
+    async def _check_files(self, batch: list[tuple[str, str]], temporary: bool) -> None:
+        self.stats["temp_files" if temporary else "stored_files"] += len(batch)
+        if temporary:
+            candidates = {path: None for _, path in batch}
+        else:
+            keys = {path: storage.key_for(name) for name, path in batch}
+            checksums = {key.removesuffix(PEAKS_SUFFIX) for key in keys.values()}
+            async with new_session() as session:
+                query = select(Blob.checksum).where(Blob.checksum.in_(checksums))
+                known = set((await session.execute(query)).scalars())
+            candidates = {
+                path: key for path, key in keys.items() if key.removesuffix(PEAKS_SUFFIX) not in known
+            }
+        if not candidates:
+            return
+
+        deadline = time.time() - self.grace_period
+        stale = await run_in_threadpool(self._stale, list(candidates), deadline)
+        if not stale:
+            return
+        self._report("stale_temp_file" if temporary else "orphan_file", stale)
+        if not self.repair:
+            return
+
+        # Файлы с именем-хешем отдаются сборщику через пустую запись в blobs:
+        # так удаление не гонится с новой загрузкой того же содержимого.
+        reaped = {path for path in stale if self._reapable(path, candidates[path])}
+        checksums = {candidates[path].removesuffix(PEAKS_SUFFIX) for path in reaped}
+        if checksums:
+            async with new_session() as session:
+                query = insert(Blob).values([{"checksum": checksum, "ref_count": 0} for checksum in checksums])
+                await session.execute(query.on_conflict_do_nothing())
+                await session.commit()
+            self.stats["orphans_queued"] += len(checksums)
+        others = [path for path in stale if path not in reaped]
+        if others:
+            self.stats["orphans_removed"] += await run_in_threadpool(self._remove, others)
+
+
+async def main(args: argparse.Namespace) -> int:
+    reconciler = Reconciler(
+        args.repair, args.batch_size, args.workers, args.grace_period, args.recheck_delay, args.verbose,
+    )
+    started = time.perf_counter()
+    try:
+        await reconciler.check_database()
+        await reconciler.check_storage()
+    finally:
+        await engine.dispose()
+
+    stats = reconciler.stats
+    print(f"Записей blobs: {stats['blobs']}, файлов в хранилище: {stats['stored_files']}, "
+          f"временных файлов: {stats['temp_files']}")
+    for kind in ("missing_file", "ref_count_mismatch", "orphan_file", "stale_temp_file"):
+        print(f"{kind:<20} {stats[kind]}")
+    if args.repair:
+        for kind in ("files_dropped", "ref_count_fixed", "orphans_queued", "orphans_removed"):
+            print(f"{kind:<20} {stats[kind]}")
+    print(f"Готово за {time.perf_counter() - started:.1f} с")
+    found = sum(stats[kind] for kind in ("missing_file", "ref_count_mismatch", "orphan_file", "stale_temp_file"))
+    return 1 if found and not args.repair else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверка хранилища файлов с базой данных")
+    parser.add_argument("--repair", action="store_true", help="Исправить найденные расхождения")
+    parser.add_argument("--batch-size", type=int, default=settings.reconcile_batch_size)
+    parser.add_argument("--workers", type=int, default=settings.reconcile_workers)
+    parser.add_argument(
+        "--grace-period", type=float, default=settings.reconcile_grace_period,
+        help="Не трогать файлы моложе, с",
+    )
+    parser.add_argument("--recheck-delay", type=float, default=settings.reconcile_recheck_delay)
+    parser.add_argument("--verbose", action="store_true", help="Печатать каждое расхождение")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+
+
+class UsersDelete(BaseModel):
+    user_ids: list[int] = Field(min_length=1, max_length=1000)
+
+
+class UsersDeleted(BaseModel):
+    deleted: list[int]
+
+
+class UserQuota(BaseModel):
+    quota_bytes: int | None = Field(default=None, ge=0)
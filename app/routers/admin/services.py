@@ -1,11 +1,13 @@
-import os
 from typing import Sequence
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.routers.admin.reaper import blob_reaper
 from app.routers.audio.models import AudioFile
+from app.routers.audio.services import hot_file_cache, ownership_cache, release_blobs
 from app.routers.auth.models import User
+from app.routers.auth.services import user_cache
 
 async def make_user_admin(
     session: AsyncSession,
@@ -13,25 +15,54 @@ async def make_user_admin(
 ) -> None:
     user.is_admin = True
     await session.commit()
+    user_cache.invalidate(user.yandex_id)
 
 async def delete_user_by_id(
     session: AsyncSession,
     user_id: int
 ) -> None:
-    query = select(AudioFile).filter(AudioFile.user_id == user_id)
+    await delete_users_by_ids(session, [user_id])
+
+async def delete_users_by_ids(
+    session: AsyncSession,
+    user_ids: Sequence[int]
+) -> Sequence[int]:
+    query = select(AudioFile.id, AudioFile.user_id, AudioFile.checksum).filter(AudioFile.user_id.in_(user_ids))
     result = await session.execute(query)
-    audio_files = result.scalars().all()
+    files = result.all()
+    checksums = [file.checksum for file in files]
 
-    delete_users_files(audio_files)
+    query = delete(User).filter(User.id.in_(user_ids)).returning(User.id, User.yandex_id)
+    result = await session.execute(query)
+    deleted_users = result.all()
 
-    query = delete(User).filter(User.id == user_id)
-    await session.execute(query)
+    await delete_users_files(session, checksums)
     await session.commit()
+    for deleted_user in deleted_users:
+        user_cache.invalidate(deleted_user.yandex_id)
+    for file in files:
+        ownership_cache.invalidate((file.id, file.user_id))
+        hot_file_cache.discard(file.checksum)
+    if checksums:
+        blob_reaper.wake()
+    return [deleted_user.id for deleted_user in deleted_users]
 
-def delete_users_files(
-    audio_files: Sequence[AudioFile]
+async def delete_users_files(
+    session: AsyncSession,
+    checksums: Sequence[str]
 ) -> None:
-    if not audio_files:
+    if not checksums:
         return
-    for audio_file in audio_files:
-        os.remove(audio_file.path)
\ No newline at end of file
+    await release_blobs(session, checksums)
+
+async def set_user_quota(
+    session: AsyncSession,
+    user_id: int,
+    quota: int | None
+) -> bool:
+    query = update(User).where(User.id == user_id).values(storage_quota=quota).returning(User.yandex_id)
+    yandex_id = (await session.execute(query)).scalar_one_or_none()
+    await session.commit()
+    if yandex_id is not None:
+        user_cache.invalidate(yandex_id)
+    return yandex_id is not None
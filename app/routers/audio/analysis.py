@@ -0,0 +1,233 @@
+import array
+import os
+import struct
+import sys
+from typing import BinaryIO
+
+
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+PEAKS_READ_SIZE = 4 * 1024 * 1024
+UNSIGNED_TO_SIGNED = bytes((value - 128) & 0xFF for value in range(256))
+
+
+def _empty_metadata(codec: str | None) -> dict:
+    return {"codec": codec, "duration": None, "sample_rate": None, "channels": None, "bitrate": None}
+
+
+def _parse_wav(file: BinaryIO, file_size: int) -> dict:
+    metadata = _empty_metadata("wav")
+    file.seek(12)
+    fmt = None
+    while header := file.read(8):
+        if len(header) < 8:
+            break
+        chunk_id, chunk_size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            body = file.read(chunk_size + (chunk_size & 1))
+            fmt = list(struct.unpack("<HHIIHH", body[:16]))
+            if fmt[0] == 0xFFFE and len(body) >= 26:
+                fmt[0] = struct.unpack("<H", body[24:26])[0]
+        elif chunk_id == b"data":
+            if fmt is None:
+                break
+            audio_format, channels, sample_rate, byte_rate, block_align, bits = fmt
+            data_size = min(chunk_size, file_size - file.tell())
+            metadata.update(
+                sample_rate=sample_rate,
+                channels=channels,
+                bitrate=byte_rate * 8,
+                duration=data_size / byte_rate if byte_rate else None,
+                pcm={
+                    "format": audio_format,
+                    "bits": bits,
+                    "block_align": block_align,
+                    "offset": file.tell(),
+                    "size": data_size,
+                },
+            )
+            break
+        else:
+            file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    return metadata
+
+
+def _parse_flac(file: BinaryIO) -> dict:
+    metadata = _empty_metadata("flac")
+    file.seek(4)
+    while header := file.read(4):
+        block_type, block_size = header[0] & 0x7F, int.from_bytes(header[1:4], "big")
+        if block_type == 0:
+            info = file.read(block_size)
+            packed = int.from_bytes(info[10:18], "big")
+            sample_rate = packed >> 44
+            channels = ((packed >> 41) & 0x7) + 1
+            total_samples = packed & 0xFFFFFFFFF
+            metadata.update(sample_rate=sample_rate, channels=channels)
+            if sample_rate and total_samples:
+                metadata["duration"] = total_samples / sample_rate
+            break
+        if header[0] & 0x80:
+            break
+        file.seek(block_size, os.SEEK_CUR)
+    return metadata
+
+
+def _skip_id3(file: BinaryIO) -> int:
+    file.seek(0)
+    header = file.read(10)
+    if header[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def _parse_mp3(file: BinaryIO, file_size: int) -> dict:
+    metadata = _empty_metadata("mp3")
+    offset = _skip_id3(file)
+    file.seek(offset)
+    data = file.read(64 * 1024)
+    for index in range(len(data) - 4):
+        if data[index] != 0xFF or data[index + 1] & 0xE0 != 0xE0:
+            continue
+        version = (data[index + 1] >> 3) & 0x3
+        layer = (data[index + 1] >> 1) & 0x3
+        bitrate_index = data[index + 2] >> 4
+        rate_index = (data[index + 2] >> 2) & 0x3
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        channels = 1 if data[index + 3] >> 6 == 3 else 2
+        bitrate = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+        samples_per_frame = 1152 if version == 3 else 576
+        metadata.update(sample_rate=sample_rate, channels=channels, bitrate=bitrate)
+
+        side_info = (32 if channels == 2 else 17) if version == 3 else (17 if channels == 2 else 9)
+        xing = index + 4 + side_info
+        if data[xing:xing + 4] in (b"Xing", b"Info") and data[xing + 7] & 0x1:
+            frames = int.from_bytes(data[xing + 8:xing + 12], "big")
+            metadata["duration"] = frames * samples_per_frame / sample_rate
+            audio_size = file_size - offset - index
+            metadata["bitrate"] = int(audio_size * 8 / metadata["duration"]) if metadata["duration"] else bitrate
+        else:
+            metadata["duration"] = (file_size - offset - index) * 8 / bitrate
+        break
+    return metadata
+
+
+def _parse_ogg(file: BinaryIO, file_size: int) -> dict:
+    metadata = _empty_metadata("ogg")
+    header = file.read(27)
+    segments = file.read(header[26])
+    packet = file.read(sum(segments))
+    granule_rate, pre_skip = None, 0
+    if packet.startswith(b"\x01vorbis"):
+        channels, sample_rate, _, nominal_bitrate = struct.unpack("<BIiI", packet[11:24])
+        metadata.update(codec="vorbis", channels=channels, sample_rate=sample_rate)
+        metadata["bitrate"] = nominal_bitrate or None
+        granule_rate = sample_rate
+    elif packet.startswith(b"OpusHead"):
+        channels, pre_skip, sample_rate = struct.unpack("<BHI", packet[9:16])
+        metadata.update(codec="opus", channels=channels, sample_rate=sample_rate or 48000)
+        granule_rate = 48000
+    elif packet.startswith(b"\x7fFLAC"):
+        packed = int.from_bytes(packet[27:35], "big")
+        metadata.update(codec="flac", sample_rate=packed >> 44, channels=((packed >> 41) & 0x7) + 1)
+        granule_rate = metadata["sample_rate"]
+
+    tail_size = min(file_size, 64 * 1024)
+    file.seek(file_size - tail_size)
+    tail = file.read(tail_size)
+    last_page = tail.rfind(b"OggS")
+    if granule_rate and last_page != -1 and last_page + 14 <= len(tail):
+        granule = struct.unpack("<q", tail[last_page + 6:last_page + 14])[0] - pre_skip
+        if granule > 0:
+            metadata["duration"] = granule / granule_rate
+            if not metadata["bitrate"]:
+                metadata["bitrate"] = int(file_size * 8 / metadata["duration"])
+    return metadata
+
+
+def parse_metadata(path: str) -> dict:
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        magic = file.read(12)
+        if magic[:4] == b"RIFF" and magic[8:12] == b"WAVE":
+            return _parse_wav(file, file_size)
+        if magic[:4] == b"fLaC":
+            return _parse_flac(file)
+        if magic[:4] == b"OggS":
+            file.seek(0)
+            return _parse_ogg(file, file_size)
+        if magic[:3] == b"ID3" or (len(magic) >= 2 and magic[0] == 0xFF and magic[1] & 0xE0 == 0xE0):
+            return _parse_mp3(file, file_size)
+    return _empty_metadata(None)
+
+
+def _samples(chunk: bytes, audio_format: int, bits: int) -> memoryview:
+    if audio_format == 3:
+        samples = array.array("f", chunk)
+    elif bits == 16:
+        samples = array.array("h", chunk)
+    else:
+        width = bits // 8
+        converted = bytearray(len(chunk) // width * 2)
+        if bits == 8:
+            converted[1::2] = chunk.translate(UNSIGNED_TO_SIGNED)
+        else:
+            converted[0::2] = chunk[width - 2::width]
+            converted[1::2] = chunk[width - 1::width]
+        samples = array.array("h", bytes(converted))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return memoryview(samples)
+
+
+def _to_int16(value: float, audio_format: int) -> int:
+    if audio_format == 3:
+        return int(max(-1.0, min(1.0, value)) * 32767)
+    return value
+
+
+def compute_peaks(path: str, pcm: dict, buckets: int) -> bytes:
+    audio_format, bits = pcm["format"], pcm["bits"]
+    if (audio_format, bits) not in ((1, 8), (1, 16), (1, 24), (1, 32), (3, 32)):
+        return b""
+    block_align = pcm["block_align"]
+    frames = pcm["size"] // block_align
+    if not frames:
+        return b""
+    frames_per_bucket = max(1, -(-frames // buckets))
+    bucket_bytes = frames_per_bucket * block_align
+    read_size = max(bucket_bytes, PEAKS_READ_SIZE // bucket_bytes * bucket_bytes)
+    samples_per_bucket = bucket_bytes // (bits // 8)
+
+    peaks = array.array("h")
+    remaining = frames * block_align
+    with open(path, "rb") as file:
+        file.seek(pcm["offset"])
+        while remaining > 0:
+            chunk = file.read(min(read_size, remaining))
+            if len(chunk) < block_align:
+                break
+            remaining -= len(chunk)
+            samples = _samples(chunk[:len(chunk) // block_align * block_align], audio_format, bits)
+            for start in range(0, len(samples), samples_per_bucket):
+                bucket = samples[start:start + samples_per_bucket]
+                peaks.append(_to_int16(min(bucket), audio_format))
+                peaks.append(_to_int16(max(bucket), audio_format))
+    if sys.byteorder == "big":
+        peaks.byteswap()
+    return peaks.tobytes()
+
+
+def analyze(path: str, buckets: int) -> tuple[dict, bytes]:
+    metadata = parse_metadata(path)
+    pcm = metadata.pop("pcm", None)
+    peaks = compute_peaks(path, pcm, buckets) if pcm else b""
+    return metadata, peaks
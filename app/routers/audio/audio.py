@@ -1,33 +1,83 @@
 from typing import Annotated, List
-from fastapi import APIRouter, Depends, File, UploadFile, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import StreamingResponse
 
 from app.deps import session_dep
-from app.routers.audio.schemas import AudioSchema
-from app.routers.audio.services import get_file_by_id, get_list_audio_files, upload_file
+from app.ratelimit import rate_limited
+from app.responses import FastJSONResponse, model_response, rows_response
+from app.routers.audio.export import stream_zip
+from app.routers.audio.models import AudioFile
+from app.routers.audio.responses import AudioFileResponse
+from app.routers.audio.processing import peaks_key
+from app.routers.audio.schemas import (
+    AudioBatchItem,
+    AudioInfoSchema,
+    AudioSchema,
+    UploadCreate,
+    UploadSessionSchema,
+)
+from app.routers.audio.services import (
+    delete_file,
+    get_file_by_id,
+    get_file_ref,
+    get_list_audio_files,
+    hot_file_cache,
+    upload_file,
+    upload_files,
+)
+from app.routers.audio.uploads import (
+    abort_upload,
+    chunks_total,
+    complete_upload,
+    create_upload,
+    get_completed_file,
+    get_received_chunks,
+    get_upload,
+    write_chunk,
+)
 from app.routers.auth.models import User
+from app.settings import settings
+from app.storage import storage
 from app.utils import get_current_auth_user
 
+AUDIO_SCHEMA_COLUMNS = [getattr(AudioFile, field) for field in AudioSchema.model_fields]
+
 router = APIRouter(
     prefix="/audio",
-    tags=["audio"]
+    tags=["audio"],
+    default_response_class=FastJSONResponse,
 )
 
 @router.get(
     "/",
     response_model=List[AudioSchema],
     summary="Получение списка загруженных аудиофайлов пользователем",
+    description=(
+        "Список отсортирован по id. Без limit и cursor возвращается весь список\n"
+        "Если передан limit или cursor, список отдается страницами (по умолчанию "
+        f"{settings.list_default_limit} файлов), cursor следующей страницы возвращается в заголовке X-Next-Cursor"
+    ),
     status_code=status.HTTP_200_OK
 )
 async def get_file_list(
     session: session_dep,
-    user: Annotated[User, Depends(get_current_auth_user)]
+    user: Annotated[User, Depends(get_current_auth_user)],
+    limit: Annotated[int | None, Query(ge=1, le=settings.list_max_limit)] = None,
+    cursor: int | None = None,
 ):
-    audio = await get_list_audio_files(session, user)
-    return [AudioSchema.model_validate(audio_) for audio_ in audio]
+    if limit is None and cursor is None:
+        return rows_response(await get_list_audio_files(session, user, columns=AUDIO_SCHEMA_COLUMNS))
+    limit = limit or settings.list_default_limit
+    audio = await get_list_audio_files(session, user, limit + 1, cursor, AUDIO_SCHEMA_COLUMNS)
+    headers = None
+    if len(audio) > limit:
+        audio = audio[:limit]
+        headers = {"X-Next-Cursor": str(audio[-1].id)}
+    return rows_response(audio, headers)
 
 @router.post(
     "/",
+    dependencies=[rate_limited("upload")],
     status_code=status.HTTP_201_CREATED,
     response_model=AudioSchema,
     summary="Загрузка аудио файла",
@@ -40,17 +90,229 @@ async def upload_audio_file(
     file: UploadFile = File(...),
 ):
     audio_file = await upload_file(session, user, file, file_name)
-    return AudioSchema.model_validate(audio_file)
+    return model_response(AudioSchema.model_validate(audio_file), status.HTTP_201_CREATED)
+
+@router.post(
+    "/batch",
+    dependencies=[rate_limited("upload")],
+    status_code=status.HTTP_200_OK,
+    response_model=List[AudioBatchItem],
+    summary="Загрузка нескольких аудио файлов",
+    description=(
+        "Файлы сохраняются под своими исходными именами\n"
+        "Результат возвращается для каждого файла: status_code 201 и file при успехе, иначе status_code и detail"
+    )
+)
+async def upload_audio_files(
+    session: session_dep,
+    user: Annotated[User, Depends(get_current_auth_user)],
+    files: List[UploadFile] = File(...),
+):
+    if len(files) > settings.batch_max_files:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"За один запрос можно загрузить не больше {settings.batch_max_files} файлов"
+        )
+    return await upload_files(session, user, files)
+
+def upload_session_schema(upload, received_chunks: list[int], file=None) -> UploadSessionSchema:
+    return UploadSessionSchema(
+        id=upload.id,
+        name=upload.name,
+        size=upload.size,
+        chunk_size=upload.chunk_size,
+        chunks_total=chunks_total(upload),
+        status=upload.status,
+        received_chunks=received_chunks,
+        file=AudioSchema.model_validate(file) if file is not None else None,
+        detail=upload.detail,
+    )
+
+@router.post(
+    "/uploads",
+    status_code=status.HTTP_201_CREATED,
+    response_model=UploadSessionSchema,
+    summary="Начать загрузку файла по частям",
+    description=(
+        "name передается вместе с расширением, size - полный размер файла в байтах\n"
+        "Части размером chunk_size загружаются через PUT /audio/uploads/{upload_id}/chunks/{index} "
+        "в любом порядке и параллельно"
+    )
+)
+async def create_upload_session(
+    session: session_dep,
+    body: UploadCreate,
+    user: Annotated[User, Depends(get_current_auth_user)],
+):
+    upload = await create_upload(session, user, body.name, body.size)
+    return upload_session_schema(upload, [])
+
+@router.get(
+    "/uploads/{upload_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=UploadSessionSchema,
+    summary="Состояние загрузки по частям",
+    description=(
+        "received_chunks - номера уже принятых частей, остальные нужно догрузить\n"
+        "После завершения status done и file - созданный файл, либо status failed и detail - причина"
+    )
+)
+async def get_upload_session(
+    session: session_dep,
+    upload_id: str,
+    user: Annotated[User, Depends(get_current_auth_user)],
+):
+    upload = await get_upload(session, upload_id, user)
+    return upload_session_schema(
+        upload, await get_received_chunks(session, upload), await get_completed_file(session, upload)
+    )
+
+@router.put(
+    "/uploads/{upload_id}/chunks/{index}",
+    dependencies=[rate_limited("upload")],
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Загрузить часть файла",
+    description="Тело запроса - байты части, все части кроме последней ровно chunk_size байт"
+)
+async def put_upload_chunk(
+    session: session_dep,
+    upload_id: str,
+    index: int,
+    request: Request,
+    user: Annotated[User, Depends(get_current_auth_user)],
+):
+    upload = await get_upload(session, upload_id, user)
+    await write_chunk(session, upload, index, request)
+
+@router.post(
+    "/uploads/{upload_id}/complete",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=UploadSessionSchema,
+    summary="Завершить загрузку по частям",
+    description=(
+        "Файл проверяется в фоне, пока загрузка в статусе completing\n"
+        "Результат нужно получить через GET /audio/uploads/{upload_id}"
+    )
+)
+async def complete_upload_session(
+    session: session_dep,
+    upload_id: str,
+    user: Annotated[User, Depends(get_current_auth_user)],
+):
+    upload = await get_upload(session, upload_id, user)
+    upload = await complete_upload(session, upload)
+    return model_response(upload_session_schema(upload, []), status.HTTP_202_ACCEPTED)
+
+@router.delete(
+    "/uploads/{upload_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Отменить загрузку по частям"
+)
+async def abort_upload_session(
+    session: session_dep,
+    upload_id: str,
+    user: Annotated[User, Depends(get_current_auth_user)],
+):
+    upload = await get_upload(session, upload_id, user)
+    await abort_upload(session, upload)
+
+@router.get(
+    "/export",
+    dependencies=[rate_limited("download")],
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    summary="Скачать аудиофайлы одним ZIP архивом",
+    description=(
+        "Без ids в архив попадают все файлы пользователя\n"
+        "Архив ZIP64 без сжатия собирается на лету"
+    )
+)
+async def export_audio_files(
+    user: Annotated[User, Depends(get_current_auth_user)],
+    ids: Annotated[List[int] | None, Query(max_length=settings.list_max_limit)] = None,
+):
+    return StreamingResponse(
+        stream_zip(user, ids),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="audio.zip"'},
+    )
 
 @router.get(
     "/{file_id}",
+    dependencies=[rate_limited("download")],
     status_code=status.HTTP_200_OK,
-    summary="Скачать загруженный файл"
+    summary="Скачать загруженный файл",
+    description="Поддерживаются Range, If-Range, If-None-Match и If-Modified-Since"
 )
 async def get_audio_file(
     session: session_dep,
     file_id: int,
     user: Annotated[User, Depends(get_current_auth_user)],
+):
+    file = await get_file_ref(session, file_id, user)
+    return AudioFileResponse(
+        storage, file.checksum, etag=file.checksum, filename=file.name, cache=hot_file_cache,
+    )
+
+@router.delete(
+    "/{file_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Удалить загруженный файл",
+    description="Место в квоте освобождается сразу, сам файл удаляется в фоне"
+)
+async def delete_audio_file(
+    session: session_dep,
+    file_id: int,
+    user: Annotated[User, Depends(get_current_auth_user)],
+):
+    file = await get_file_by_id(session, file_id, user)
+    await delete_file(session, file)
+    return {"message": f"Файл с id {file_id} удален"}
+
+@router.get(
+    "/{file_id}/info",
+    status_code=status.HTTP_200_OK,
+    response_model=AudioInfoSchema,
+    summary="Метаданные загруженного файла",
+    description=(
+        "Метаданные заполняются в фоне после загрузки\n"
+        "processing_status: pending - обработка еще идет, done - готово, failed - файл не удалось разобрать"
+    )
+)
+async def get_audio_file_info(
+    session: session_dep,
+    file_id: int,
+    user: Annotated[User, Depends(get_current_auth_user)],
+):
+    file = await get_file_by_id(session, file_id, user)
+    return model_response(AudioInfoSchema.model_validate(file))
+
+@router.get(
+    "/{file_id}/peaks",
+    dependencies=[rate_limited("download")],
+    status_code=status.HTTP_200_OK,
+    summary="Пики волны загруженного файла",
+    description=(
+        "Бинарный массив пар (min, max) int16 little-endian, peaks_count пар из /info\n"
+        "Пики считаются только для несжатого WAV"
+    )
+)
+async def get_audio_file_peaks(
+    session: session_dep,
+    file_id: int,
+    user: Annotated[User, Depends(get_current_auth_user)],
 ):
     file = await get_file_by_id(session, file_id, user)
-    return FileResponse(file.path, media_type="audio/mpeg", filename=file.name)
\ No newline at end of file
+    if not file.peaks_count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пики еще не готовы" if file.processing_status == "pending" else "Пики недоступны"
+        )
+    return AudioFileResponse(
+        storage,
+        peaks_key(file.checksum),
+        etag=peaks_key(file.checksum),
+        filename=file.name + ".peaks",
+        media_type="application/octet-stream",
+        cache=hot_file_cache,
+    )
@@ -0,0 +1,70 @@
+import io
+import time
+import zipfile
+from typing import AsyncIterator, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.deps import new_session
+from app.metrics import operation_duration_seconds
+from app.routers.audio.models import AudioFile
+from app.routers.audio.services import get_list_audio_files
+from app.routers.auth.models import User
+from app.settings import settings
+from app.storage import storage
+
+
+EXPORT_COLUMNS = [AudioFile.id, AudioFile.name, AudioFile.checksum]
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def iter_export_files(user: User, ids: Sequence[int] | None) -> AsyncIterator:
+    cursor = None
+    while True:
+        async with new_session() as session:
+            page = await get_list_audio_files(
+                session, user, settings.list_max_limit, cursor, EXPORT_COLUMNS, ids
+            )
+        for file in page:
+            yield file
+        if len(page) < settings.list_max_limit:
+            return
+        cursor = page[-1].id
+
+async def stream_zip(user: User, ids: Sequence[int] | None = None) -> AsyncIterator[bytes]:
+    buffer = ZipStreamBuffer()
+    with operation_duration_seconds.time("file_export"):
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            async for file in iter_export_files(user, ids):
+                try:
+                    stored_object = await storage.stat(file.checksum)
+                except FileNotFoundError:
+                    continue
+                info = zipfile.ZipInfo(file.name, time.localtime(stored_object.mtime)[:6])
+                info.file_size = stored_object.size
+                with archive.open(info, "w", force_zip64=True) as entry:
+                    async for chunk in storage.iter_range(
+                        file.checksum, 0, stored_object.size, settings.export_chunk_size
+                    ):
+                        await run_in_threadpool(entry.write, chunk)
+                        if data := buffer.take():
+                            yield data
+                if data := buffer.take():
+                    yield data
+        yield buffer.take()
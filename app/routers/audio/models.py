@@ -1,15 +1,66 @@
+from datetime import datetime
+
 from app.db import Base
 
-from sqlalchemy import String, Integer, ForeignKey
+from sqlalchemy import BigInteger, DateTime, Float, String, Integer, ForeignKey, Index, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    __table_args__ = (
+        Index("ix_blobs_unreferenced", "checksum", postgresql_where=text("ref_count <= 0")),
+    )
+
+    checksum: Mapped[str] = mapped_column(String(64), primary_key=True)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    delete_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 class AudioFile(Base):
     __tablename__ = "audio_files"
+    __table_args__ = (
+        Index("ix_audio_files_user_id_id", "user_id", "id"),
+        Index("ix_audio_files_pending", "id", postgresql_where=text("processing_status = 'pending'")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False, unique=True)
     path: Mapped[str] = mapped_column(String(255), nullable=False)
+    checksum: Mapped[str] = mapped_column(String(64), ForeignKey("blobs.checksum"), nullable=False, index=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    size_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    processing_status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    codec: Mapped[str | None] = mapped_column(String(16))
+    duration: Mapped[float | None] = mapped_column(Float)
+    sample_rate: Mapped[int | None] = mapped_column(Integer)
+    channels: Mapped[int | None] = mapped_column(Integer)
+    bitrate: Mapped[int | None] = mapped_column(Integer)
+    peaks_count: Mapped[int | None] = mapped_column(Integer)
+
+    user = relationship("User", back_populates="audio_files")
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    chunk_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="open")
+    detail: Mapped[str | None] = mapped_column(String(200))
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
+
+
+class UploadChunk(Base):
+    __tablename__ = "upload_chunks"
 
-    user = relationship("User", back_populates="audio_files")
\ No newline at end of file
+    upload_id: Mapped[str] = mapped_column(
+        String(32), ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    index: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+
+from app.deps import new_session
+from app.metrics import operation_duration_seconds
+from app.routers.audio.analysis import analyze
+from app.routers.audio.models import AudioFile
+from app.settings import settings
+from app.storage import storage
+
+
+logger = logging.getLogger(__name__)
+
+PEAKS_SUFFIX = ".peaks"
+METADATA_COLUMNS = ("codec", "duration", "sample_rate", "channels", "bitrate", "peaks_count")
+
+
+def peaks_key(checksum: str) -> str:
+    return checksum + PEAKS_SUFFIX
+
+
+def _write_temp(data: bytes) -> str:
+    fd, temp_path = tempfile.mkstemp(dir=settings.audio_temp_path)
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    return temp_path
+
+
+class AudioProcessor:
+    def __init__(self, workers: int, buckets: int, queue_size: int, batch_size: int, interval: float) -> None:
+        self.workers = workers
+        self.buckets = buckets
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sweeping = True
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._queue: asyncio.Queue[tuple[int, str]] | None = None
+        self._queued: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return len(self._queued)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _analyze(self, checksum: str) -> dict:
+        loop = asyncio.get_running_loop()
+        with operation_duration_seconds.time("audio_analyze"):
+            metadata, peaks = await loop.run_in_executor(
+                self._get_executor(), analyze, storage.local_path(checksum), self.buckets
+            )
+        metadata["peaks_count"] = len(peaks) // 4 if peaks else None
+        if peaks:
+            temp_path = await run_in_threadpool(_write_temp, peaks)
+            await storage.save(temp_path, peaks_key(checksum))
+        return metadata
+
+    async def _process(self, file_id: int, checksum: str) -> None:
+        try:
+            async with new_session() as session:
+                # Строка блокируется на время анализа: сверка в другом воркере
+                # пропустит ее и не станет обрабатывать файл повторно.
+                query = (
+                    select(AudioFile.id)
+                    .where(AudioFile.id == file_id, AudioFile.processing_status == "pending")
+                    .with_for_update(skip_locked=True)
+                )
+                if (await session.execute(query)).first() is None:
+                    return
+                query = (
+                    select(*(getattr(AudioFile, column) for column in METADATA_COLUMNS))
+                    .where(AudioFile.checksum == checksum, AudioFile.processing_status == "done")
+                    .limit(1)
+                )
+                known = (await session.execute(query)).first()
+                metadata = known._asdict() if known else await self._analyze(checksum)
+                query = (
+                    update(AudioFile)
+                    .where(AudioFile.id == file_id)
+                    .values(**metadata, processing_status="done")
+                )
+                await session.execute(query)
+                await session.commit()
+            self.processed += 1
+        except Exception:
+            logger.exception("Не удалось обработать аудиофайл %s", file_id)
+            self.failed += 1
+            async with new_session() as session:
+                query = update(AudioFile).where(AudioFile.id == file_id).values(processing_status="failed")
+                await session.execute(query)
+                await session.commit()
+
+    async def _consume(self) -> None:
+        while True:
+            file_id, checksum = await self._queue.get()
+            try:
+                await self._process(file_id, checksum)
+            except Exception:
+                logger.exception("Не удалось сохранить статус аудиофайла %s", file_id)
+            finally:
+                self._queued.discard(file_id)
+
+    def submit(self, file_id: int, checksum: str) -> None:
+        if self._queue is None or file_id in self._queued:
+            return
+        try:
+            self._queue.put_nowait((file_id, checksum))
+        except asyncio.QueueFull:
+            # Файл остается в статусе pending и будет подобран следующей сверкой.
+            self.dropped += 1
+            self._wakeup.set()
+            return
+        self._queued.add(file_id)
+
+    async def resume(self) -> int:
+        queued = 0
+        last_id = 0
+        while True:
+            async with new_session() as session:
+                query = (
+                    select(AudioFile.id, AudioFile.checksum)
+                    .where(AudioFile.processing_status == "pending", AudioFile.id > last_id)
+                    .order_by(AudioFile.id)
+                    .limit(self.batch_size)
+                )
+                rows = (await session.execute(query)).all()
+            for file_id, checksum in rows:
+                if file_id not in self._queued:
+                    self._queued.add(file_id)
+                    await self._queue.put((file_id, checksum))
+                    queued += 1
+            if len(rows) < self.batch_size:
+                return queued
+            last_id = rows[-1].id
+
+    async def _run(self) -> None:
+        while True:
+            if self.sweeping:
+                try:
+                    await self.resume()
+                except Exception:
+                    logger.exception("Не удалось загрузить необработанные аудиофайлы")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def set_sweeping(self, sweeping: bool) -> None:
+        self.sweeping = sweeping
+        if sweeping:
+            self.wake()
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+            self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers * 2)]
+            self._tasks.append(asyncio.create_task(self._run()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+audio_processor = AudioProcessor(
+    settings.processing_workers,
+    settings.peaks_buckets,
+    settings.processing_queue_size,
+    settings.processing_batch_size,
+    settings.processing_sweep_interval,
+)
@@ -0,0 +1,316 @@
+import mmap
+import os
+import secrets
+from datetime import UTC, datetime
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.cache import CachedFile, HotFileCache
+from app.metrics import Counter, operation_duration_seconds
+from app.settings import settings
+from app.storage import StorageBackend, StoredObject
+
+
+MAX_RANGES = 16
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+download_bytes_total = Counter(
+    "download_bytes_total", "Отданные байты файлов по способу отправки", ("engine",),
+)
+
+
+def open_mapped(path: str):
+    file = open(path, "rb")
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        file.close()
+        raise
+    if hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return file, mapped
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+def close_mapped(file, mapped) -> None:
+    if mapped is not None:
+        mapped.close()
+    file.close()
+
+
+class AudioFileResponse(Response):
+    chunk_size = settings.download.chunk_size
+
+    def __init__(
+        self,
+        storage: StorageBackend,
+        key: str,
+        etag: str,
+        filename: str,
+        media_type: str = "audio/mpeg",
+        cache: HotFileCache | None = None,
+    ) -> None:
+        self.storage = storage
+        self.key = key
+        self.cache = None if settings.download.accel_redirect_prefix else cache
+        self.cached: CachedFile | None = None
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.etag = f'"{etag}"'
+        self.init_headers()
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = self.etag
+        content_disposition_filename = quote(filename)
+        if content_disposition_filename != filename:
+            self.headers["content-disposition"] = f"attachment; filename*=utf-8''{content_disposition_filename}"
+        else:
+            self.headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.cache is not None and (cached := self.cache.get(self.key)) is not None:
+            self.cached = cached
+            self.stored_object = StoredObject(len(cached.data), cached.mtime)
+        else:
+            self.stored_object = await self.storage.stat(self.key)
+        stored_object = self.stored_object
+        file_size = stored_object.size
+        last_modified = int(stored_object.mtime)
+        self.headers["last-modified"] = formatdate(last_modified, usegmt=True)
+
+        request_headers = Headers(scope=scope)
+        send_header_only = scope["method"].upper() == "HEAD"
+
+        if self._is_not_modified(request_headers, last_modified):
+            del self.headers["content-type"]
+            await self._send_start(send, 304)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if settings.download.accel_redirect_prefix:
+            await self._send_accel_redirect(send)
+            return
+
+        ranges = None
+        http_range = request_headers.get("range")
+        if http_range is not None and self._if_range_matches(request_headers.get("if-range")):
+            ranges = parse_range_header(http_range, file_size)
+
+        if ranges is None:
+            self.headers["content-length"] = str(file_size)
+            await self._send_start(send, 200)
+            await self._send_ranges(scope, send, [(0, file_size)], send_header_only)
+        elif not ranges:
+            del self.headers["content-type"]
+            self.headers["content-range"] = f"bytes */{file_size}"
+            self.headers["content-length"] = "0"
+            await self._send_start(send, 416)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+            self.headers["content-length"] = str(end - start)
+            await self._send_start(send, 206)
+            await self._send_ranges(scope, send, ranges, send_header_only)
+        else:
+            await self._send_multipart(scope, send, ranges, file_size, send_header_only)
+
+    def _is_not_modified(self, request_headers: Headers, last_modified: int) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=UTC)
+            return datetime.fromtimestamp(last_modified, UTC) <= since
+        return False
+
+    def _if_range_matches(self, if_range: str | None) -> bool:
+        if if_range is None:
+            return True
+        if if_range.startswith('"'):
+            return if_range == self.etag
+        return if_range == self.headers["last-modified"]
+
+    async def _send_start(self, send: Send, status_code: int) -> None:
+        await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+
+    async def _send_accel_redirect(self, send: Send) -> None:
+        # Отдачу файла и Range берет на себя фронтовой прокси (nginx internal location),
+        # путь считается от корня хранилища, чтобы в нем остался каталог бакета.
+        path = os.path.relpath(self.storage.local_path(self.key), settings.audio_storage_path)
+        self.headers["x-accel-redirect"] = settings.download.accel_redirect_prefix + quote(path)
+        await self._send_start(send, 200)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    def _engine(self, scope: Scope) -> str:
+        if self.cached is not None:
+            return "memory"
+        if settings.download.sendfile and ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            return "sendfile"
+        if settings.download.mmap:
+            return "mmap"
+        return "read"
+
+    async def _send_ranges(
+        self,
+        scope: Scope,
+        send: Send,
+        ranges: list[tuple[int, int]],
+        send_header_only: bool,
+        separators: list[bytes] | None = None,
+    ) -> None:
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if self.cached is None and self.cache is not None and self.cache.should_admit(
+            self.key, self.stored_object.size
+        ):
+            await self._load()
+        engine = self._engine(scope)
+        file = mapped = None
+        path = self.storage.local_path(self.key)
+        if engine == "sendfile":
+            file = await run_in_threadpool(open, path, "rb")
+        elif engine == "mmap":
+            try:
+                file, mapped = await run_in_threadpool(open_mapped, path)
+            except (OSError, ValueError):
+                engine = "read"
+        try:
+            with operation_duration_seconds.time("file_download"):
+                for index, (start, end) in enumerate(ranges):
+                    if separators is not None:
+                        await send({"type": "http.response.body", "body": separators[index], "more_body": True})
+                    if engine == "memory":
+                        await self._send_memory(send, start, end)
+                    elif engine == "sendfile":
+                        await self._send_zerocopy(send, file, start, end)
+                    elif engine == "mmap":
+                        await self._send_mapped(send, mapped, start, end)
+                    else:
+                        await self._send_read(send, start, end)
+                    download_bytes_total.inc(engine, amount=end - start)
+        finally:
+            if file is not None:
+                await run_in_threadpool(close_mapped, file, mapped)
+        trailer = separators[-1] if separators is not None else b""
+        await send({"type": "http.response.body", "body": trailer, "more_body": False})
+
+    async def _load(self) -> None:
+        # Одновременные запросы одного файла ждут первое чтение, а не читают его каждый сам.
+        self.cached = await self.cache.get_or_load(self.key, self._read)
+
+    async def _read(self) -> CachedFile | None:
+        data = await run_in_threadpool(read_file, self.storage.local_path(self.key))
+        if len(data) == self.stored_object.size:
+            return CachedFile(data, self.stored_object.mtime)
+        return None
+
+    async def _send_memory(self, send: Send, start: int, end: int) -> None:
+        data = self.cached.data
+        body = data if start == 0 and end == len(data) else data[start:end]
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    @staticmethod
+    async def _send_zerocopy(send: Send, file, start: int, end: int) -> None:
+        await send({
+            "type": ZEROCOPY_EXTENSION,
+            "file": file,
+            "offset": start,
+            "count": end - start,
+            "more_body": True,
+        })
+
+    async def _send_mapped(self, send: Send, mapped: mmap.mmap, start: int, end: int) -> None:
+        # Срез копируется в пуле потоков: на холодном кэше страниц чтение с диска
+        # блокировало бы цикл событий, MADV_SEQUENTIAL - только подсказка ядру.
+        for offset in range(start, end, self.chunk_size):
+            chunk = await run_in_threadpool(mapped.__getitem__, slice(offset, min(offset + self.chunk_size, end)))
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    async def _send_read(self, send: Send, start: int, end: int) -> None:
+        async for chunk in self.storage.iter_range(self.key, start, end, self.chunk_size):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    async def _send_multipart(
+        self,
+        scope: Scope,
+        send: Send,
+        ranges: list[tuple[int, int]],
+        file_size: int,
+        send_header_only: bool,
+    ) -> None:
+        boundary = secrets.token_hex(13)
+        separators = []
+        for index, (start, end) in enumerate(ranges):
+            prefix = "\r\n" if index else ""
+            separators.append((
+                f"{prefix}--{boundary}\r\n"
+                f"Content-Type: {self.media_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{file_size}\r\n\r\n"
+            ).encode("latin-1"))
+        separators.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+        content_length = sum(map(len, separators)) + sum(end - start for start, end in ranges)
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await self._send_start(send, 206)
+        await self._send_ranges(scope, send, ranges, send_header_only, separators)
+
+
+def parse_range_header(http_range: str, file_size: int) -> list[tuple[int, int]] | None:
+    units, _, ranges_spec = http_range.partition("=")
+    if units.strip().lower() != "bytes" or not ranges_spec:
+        return None
+
+    ranges = []
+    for part in ranges_spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, dash, end_str = part.partition("-")
+        if not dash:
+            return None
+        try:
+            if not start_str:
+                suffix = int(end_str)
+                if suffix < 0:
+                    return None
+                start, end = max(file_size - suffix, 0), file_size
+            else:
+                start = int(start_str)
+                end = int(end_str) + 1 if end_str else file_size
+                if start < 0 or end <= start and end_str:
+                    return None
+                end = min(end, file_size)
+        except ValueError:
+            return None
+        if start < end:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
@@ -1,4 +1,6 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.settings import settings
 
 
 class AudioUpload(BaseModel):
@@ -9,4 +11,37 @@ class AudioSchema(AudioUpload):
     model_config = ConfigDict(extra="ignore", from_attributes=True)
 
     id: int
-    path: str
\ No newline at end of file
+    path: str
+
+
+class AudioInfoSchema(AudioSchema):
+    size_bytes: int
+    processing_status: str
+    codec: str | None
+    duration: float | None
+    sample_rate: int | None
+    channels: int | None
+    bitrate: int | None
+    peaks_count: int | None
+
+
+class AudioBatchItem(BaseModel):
+    name: str
+    status_code: int
+    file: AudioSchema | None = None
+    detail: str | None = None
+
+
+class UploadCreate(AudioUpload):
+    name: str = Field(min_length=1, max_length=100)
+    size: int = Field(gt=0, le=settings.upload_session_max_size)
+
+
+class UploadSessionSchema(UploadCreate):
+    id: str
+    chunk_size: int
+    chunks_total: int
+    status: str
+    received_chunks: list[int]
+    file: AudioSchema | None = None
+    detail: str | None = None
@@ -1,65 +1,411 @@
+import asyncio
+import hashlib
+import mimetypes
 import os
-import shutil
+import tempfile
+from collections import Counter
+from typing import BinaryIO, NamedTuple
+
 from fastapi import UploadFile, HTTPException, status
-from sqlalchemy import Sequence, select
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Sequence, bindparam, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import HotFileCache, TTLCache
+from app.metrics import operation_duration_seconds
 from app.settings import settings
-from app.routers.audio.models import AudioFile
+from app.storage import storage
+from app.routers.audio.models import AudioFile, Blob
+from app.routers.admin.reaper import blob_reaper
+from app.routers.audio.processing import audio_processor
 from app.routers.auth.models import User
 
 
+class FileRef(NamedTuple):
+    checksum: str
+    name: str
+
+
+ownership_cache: TTLCache[tuple[int, int], FileRef] = TTLCache(
+    settings.ownership_cache_size, settings.ownership_cache_ttl
+)
+hot_file_cache: HotFileCache[str] = HotFileCache(
+    settings.hot_cache_max_bytes, settings.hot_cache_max_file_size, settings.hot_cache_sketch_width
+)
+
 async def get_list_audio_files(
     session: AsyncSession,
     user: User,
-) -> Sequence[AudioFile]:
-    query = select(AudioFile).filter(AudioFile.user == user)
+    limit: int | None = None,
+    cursor: int | None = None,
+    columns: Sequence | None = None,
+    ids: Sequence[int] | None = None,
+) -> Sequence:
+    query = select(*columns) if columns else select(AudioFile)
+    query = query.filter(AudioFile.user_id == user.id).order_by(AudioFile.id)
+    if ids is not None:
+        query = query.filter(AudioFile.id.in_(ids))
+    if cursor is not None:
+        query = query.filter(AudioFile.id > cursor)
+    if limit is not None:
+        query = query.limit(limit)
     result = await session.execute(query)
-    audio = result.scalars().all()
+    audio = result.all() if columns else result.scalars().all()
     return audio
 
+def __copy_chunk(src: BinaryIO, dst: BinaryIO, checksum: "hashlib._Hash", chunk_size: int) -> int:
+    chunk = src.read(chunk_size)
+    if chunk:
+        checksum.update(chunk)
+        dst.write(chunk)
+    return len(chunk)
+
+def __remove_silently(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def store_blob(temp_path: str, checksum: str) -> None:
+    if await storage.exists(checksum):
+        await run_in_threadpool(__remove_silently, temp_path)
+    else:
+        await storage.save(temp_path, checksum)
+
+async def acquire_blob(
+    session: AsyncSession,
+    checksum: str,
+) -> None:
+    await acquire_blobs(session, [checksum])
+
+async def acquire_blobs(
+    session: AsyncSession,
+    checksums: Sequence[str],
+) -> None:
+    counts = Counter(checksums)
+    query = insert(Blob).values(
+        [{"checksum": checksum, "ref_count": count} for checksum, count in sorted(counts.items())]
+    )
+    query = query.on_conflict_do_update(
+        index_elements=[Blob.checksum],
+        set_={"ref_count": Blob.ref_count + query.excluded.ref_count},
+    )
+    await session.execute(query)
+
+async def release_blobs(
+    session: AsyncSession,
+    checksums: Sequence[str],
+) -> None:
+    if not checksums:
+        return
+    counts = Counter(checksums)
+    blobs = Blob.__table__
+    query = (
+        update(blobs)
+        .where(blobs.c.checksum == bindparam("b_checksum"))
+        .values(ref_count=blobs.c.ref_count - bindparam("b_count"))
+    )
+    await session.execute(query, [{"b_checksum": c, "b_count": n} for c, n in counts.items()])
+
+async def stream_to_temp(file: UploadFile, max_size: int) -> tuple[str, str, int]:
+    fd, temp_path = await run_in_threadpool(tempfile.mkstemp, dir=settings.audio_temp_path)
+    checksum = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while written := await run_in_threadpool(
+                __copy_chunk, file.file, buffer, checksum, settings.upload_chunk_size
+            ):
+                size += written
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Файл слишком большой"
+                    )
+    except BaseException:
+        await run_in_threadpool(__remove_silently, temp_path)
+        raise
+    return temp_path, checksum.hexdigest(), size
+
+def __quota_exceeded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail="Превышена квота хранилища"
+    )
+
+async def check_quota(
+    session: AsyncSession,
+    user_id: int,
+    size: int,
+) -> None:
+    query = select(
+        User.storage_used, func.coalesce(User.storage_quota, settings.user_storage_quota)
+    ).filter(User.id == user_id)
+    used, quota = (await session.execute(query)).one()
+    if used + size > quota:
+        raise __quota_exceeded()
+
+async def charge_storage(
+    session: AsyncSession,
+    user_id: int,
+    size: int,
+) -> None:
+    query = (
+        update(User)
+        .where(
+            User.id == user_id,
+            User.storage_used + size <= func.coalesce(User.storage_quota, settings.user_storage_quota),
+        )
+        .values(storage_used=User.storage_used + size)
+        .returning(User.id)
+    )
+    if (await session.execute(query)).first() is None:
+        raise __quota_exceeded()
+
+async def refund_storage(
+    session: AsyncSession,
+    user_id: int,
+    size: int,
+) -> None:
+    if size:
+        query = update(User).where(User.id == user_id).values(storage_used=User.storage_used - size)
+        await session.execute(query)
+
+def validate_upload(file: UploadFile) -> None:
+    if not file.content_type or not file.content_type.startswith("audio/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Можно загружать только аудио файлы"
+        )
+    if file.size is not None and file.size > settings.audio_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Файл слишком большой"
+        )
+
+def build_file_name(file_name: str, filename: str | None) -> str:
+    if not file_name.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Имя файла не может быть пустым"
+        )
+    _, extension = os.path.splitext(filename or "")
+    new_name = file_name+extension
+    if len(new_name) > AudioFile.name.type.length:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Имя файла должно быть не длиннее {AudioFile.name.type.length} символов"
+        )
+    return new_name
+
+def validate_upload_name(name: str) -> str:
+    file_name, _ = os.path.splitext(name)
+    new_name = build_file_name(file_name, name)
+    media_type, _ = mimetypes.guess_type(new_name)
+    if not media_type or not media_type.startswith("audio/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Можно загружать только аудио файлы"
+        )
+    return new_name
+
 async def upload_file(
     session: AsyncSession,
     user: User,
     file: UploadFile,
     file_name: str,
 ) -> AudioFile:
-    if not file.content_type.startswith("audio/"):
+    validate_upload(file)
+    new_name = build_file_name(file_name, file.filename)
+    if file.size is not None:
+        await check_quota(session, user.id, file.size)
+
+    try:
+        with operation_duration_seconds.time("file_upload"):
+            temp_path, checksum, size = await stream_to_temp(file, settings.audio_max_size)
+    except OSError:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Можно загружать только аудио файлы"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Файл не удалось сохранить"
         )
-    try:
-        _, extension = os.path.splitext(file.filename)
-        new_name = file_name+extension
-        file_location = os.path.join(settings.audio_storage_path, new_name)
 
+    return await create_audio_file(session, user, new_name, temp_path, checksum, size)
+
+async def create_audio_file(
+    session: AsyncSession,
+    user: User,
+    name: str,
+    temp_path: str,
+    checksum: str,
+    size: int,
+    reserved: bool = False,
+) -> AudioFile:
+    try:
+        if not reserved:
+            await charge_storage(session, user.id, size)
+        await acquire_blob(session, checksum)
         new_audio = AudioFile(
-            name = new_name,
-            path = file_location,
-            user_id = user.id
+            name = name,
+            path = storage.location(checksum),
+            checksum = checksum,
+            user_id = user.id,
+            size_bytes = size
         )
         session.add(new_audio)
         await session.commit()
-
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
+    except HTTPException:
+        await session.rollback()
+        await run_in_threadpool(__remove_silently, temp_path)
+        raise
     except IntegrityError:
         await session.rollback()
+        await run_in_threadpool(__remove_silently, temp_path)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Такое имя уже существует"
         )
-    except Exception:
+    except BaseException:
+        await run_in_threadpool(__remove_silently, temp_path)
+        raise
+
+    try:
+        with operation_duration_seconds.time("file_store"):
+            await store_blob(temp_path, checksum)
+    except OSError:
+        await run_in_threadpool(__remove_silently, temp_path)
+        await session.delete(new_audio)
+        await session.flush()
+        await release_blobs(session, [checksum])
+        await refund_storage(session, user.id, size)
+        await session.commit()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Файл не удалось сохранить"
         )
     await session.refresh(new_audio)
+    audio_processor.submit(new_audio.id, checksum)
     return new_audio
 
+async def upload_files(
+    session: AsyncSession,
+    user: User,
+    files: list[UploadFile],
+) -> list[dict]:
+    results = [{"name": file.filename or "", "status_code": status.HTTP_201_CREATED} for file in files]
+    temp_paths: dict[int, tuple[str, str]] = {}
+    sizes: dict[int, int] = {}
+    semaphore = asyncio.Semaphore(settings.batch_upload_concurrency)
+    seen_names = set()
+
+    def fail(index: int, status_code: int, detail: str) -> None:
+        results[index].update(status_code=status_code, detail=detail)
+
+    async def stream(index: int, file: UploadFile) -> None:
+        async with semaphore:
+            try:
+                temp_path, checksum, sizes[index] = await stream_to_temp(file, settings.audio_max_size)
+            except HTTPException as e:
+                fail(index, e.status_code, e.detail)
+            except OSError:
+                fail(index, status.HTTP_500_INTERNAL_SERVER_ERROR, "Файл не удалось сохранить")
+            else:
+                temp_paths[index] = (temp_path, checksum)
+
+    async def store(index: int, temp_path: str, checksum: str) -> None:
+        async with semaphore:
+            try:
+                await store_blob(temp_path, checksum)
+            except OSError:
+                await run_in_threadpool(__remove_silently, temp_path)
+                fail(index, status.HTTP_500_INTERNAL_SERVER_ERROR, "Файл не удалось сохранить")
+
+    to_stream = []
+    for index, file in enumerate(files):
+        try:
+            validate_upload(file)
+            file_name, _ = os.path.splitext(os.path.basename(file.filename or ""))
+            results[index]["name"] = build_file_name(file_name, file.filename)
+        except HTTPException as e:
+            fail(index, e.status_code, e.detail)
+            continue
+        if results[index]["name"] in seen_names:
+            fail(index, status.HTTP_400_BAD_REQUEST, "Такое имя уже существует")
+            continue
+        seen_names.add(results[index]["name"])
+        to_stream.append(stream(index, file))
+
+    accepted = [index for index, result in enumerate(results) if result["status_code"] == status.HTTP_201_CREATED]
+    try:
+        await check_quota(session, user.id, sum(files[index].size or 0 for index in accepted))
+    except HTTPException as e:
+        for index in accepted:
+            fail(index, e.status_code, e.detail)
+        for coroutine in to_stream:
+            coroutine.close()
+        return results
+
+    try:
+        with operation_duration_seconds.time("file_upload"):
+            await asyncio.gather(*to_stream)
+        if not temp_paths:
+            return results
+
+        checksums = [checksum for _, checksum in temp_paths.values()]
+        await acquire_blobs(session, checksums)
+        query = insert(AudioFile).values([
+            {
+                "name": results[index]["name"],
+                "path": storage.location(checksum),
+                "checksum": checksum,
+                "user_id": user.id,
+                "size_bytes": sizes[index],
+            }
+            for index, (_, checksum) in sorted(temp_paths.items())
+        ]).on_conflict_do_nothing(index_elements=[AudioFile.name]).returning(
+            AudioFile.id, AudioFile.name, AudioFile.path
+        )
+        inserted = {row.name: row for row in (await session.execute(query)).all()}
+        rejected = [index for index in temp_paths if results[index]["name"] not in inserted]
+        await release_blobs(session, [temp_paths[index][1] for index in rejected])
+        await charge_storage(
+            session, user.id, sum(sizes[index] for index in temp_paths if index not in rejected)
+        )
+        await session.commit()
+    except HTTPException as e:
+        await session.rollback()
+        await asyncio.gather(*(run_in_threadpool(__remove_silently, path) for path, _ in temp_paths.values()))
+        for index in temp_paths:
+            fail(index, e.status_code, e.detail)
+        return results
+    except BaseException:
+        await asyncio.gather(*(run_in_threadpool(__remove_silently, path) for path, _ in temp_paths.values()))
+        raise
+
+    for index in rejected:
+        temp_path, _ = temp_paths.pop(index)
+        await run_in_threadpool(__remove_silently, temp_path)
+        fail(index, status.HTTP_400_BAD_REQUEST, "Такое имя уже существует")
+
+    with operation_duration_seconds.time("file_store"):
+        await asyncio.gather(*(store(index, *temp_paths[index]) for index in temp_paths))
+
+    failed = [index for index in temp_paths if results[index]["status_code"] != status.HTTP_201_CREATED]
+    if failed:
+        query = delete(AudioFile).where(AudioFile.id.in_([inserted[results[index]["name"]].id for index in failed]))
+        await session.execute(query)
+        await release_blobs(session, [temp_paths[index][1] for index in failed])
+        await refund_storage(session, user.id, sum(sizes[index] for index in failed))
+        await session.commit()
+
+    for index, (_, checksum) in temp_paths.items():
+        if index not in failed:
+            row = inserted[results[index]["name"]]
+            results[index]["file"] = {"id": row.id, "name": row.name, "path": row.path}
+            audio_processor.submit(row.id, checksum)
+    return results
+
 async def get_file_by_id(
     session: AsyncSession,
     file_id: int,
@@ -73,4 +419,38 @@ async def get_file_by_id(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Файл не существует"
         )
-    return audio_file
\ No newline at end of file
+    return audio_file
+
+async def get_file_ref(
+    session: AsyncSession,
+    file_id: int,
+    user: User
+) -> FileRef:
+    key = (file_id, user.id)
+    if (file_ref := ownership_cache.get(key)) is not None:
+        return file_ref
+    query = select(AudioFile.checksum, AudioFile.name).where(
+        AudioFile.id == file_id, AudioFile.user_id == user.id
+    )
+    row = (await session.execute(query)).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Файл не существует"
+        )
+    file_ref = FileRef(row.checksum, row.name)
+    ownership_cache.set(key, file_ref)
+    return file_ref
+
+async def delete_file(
+    session: AsyncSession,
+    audio_file: AudioFile,
+) -> None:
+    await session.delete(audio_file)
+    await session.flush()
+    await release_blobs(session, [audio_file.checksum])
+    await refund_storage(session, audio_file.user_id, audio_file.size_bytes)
+    await session.commit()
+    ownership_cache.invalidate((audio_file.id, audio_file.user_id))
+    hot_file_cache.discard(audio_file.checksum)
+    blob_reaper.wake()
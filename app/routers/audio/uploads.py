@@ -0,0 +1,419 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import UTC, datetime, timedelta
+
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.deps import new_session
+from app.metrics import operation_duration_seconds
+from app.routers.audio.models import AudioFile, UploadChunk, UploadSession
+from app.routers.audio.services import charge_storage, create_audio_file, refund_storage, validate_upload_name
+from app.routers.auth.models import User
+from app.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# В этих статусах за загрузкой числится зарезервированное место
+RESERVED_STATUSES = ("open", "completing")
+
+
+def upload_path(upload_id: str) -> str:
+    return os.path.join(settings.audio_uploads_path, upload_id)
+
+def chunks_total(upload: UploadSession) -> int:
+    return -(-upload.size // upload.chunk_size)
+
+def __create_sparse_file(path: str, size: int) -> None:
+    with open(path, "xb") as file:
+        file.truncate(size)
+
+def remove_upload_file(upload_id: str) -> None:
+    try:
+        os.remove(upload_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+def _hash_file(path: str, chunk_size: int) -> str:
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+async def __name_taken(session: AsyncSession, name: str) -> bool:
+    query = select(AudioFile.id).filter(AudioFile.name == name)
+    return (await session.execute(query)).first() is not None
+
+async def create_upload(
+    session: AsyncSession,
+    user: User,
+    name: str,
+    size: int,
+) -> UploadSession:
+    name = validate_upload_name(name)
+    if await __name_taken(session, name):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Такое имя уже существует"
+        )
+    # Место резервируется сразу, чтобы параллельные загрузки не превысили
+    # квоту к моменту завершения. При завершении резерв становится платой за файл.
+    await charge_storage(session, user.id, size)
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user.id,
+        name=name,
+        size=size,
+        chunk_size=settings.upload_session_chunk_size,
+    )
+    try:
+        await run_in_threadpool(__create_sparse_file, upload_path(upload.id), size)
+    except BaseException:
+        await session.rollback()
+        raise
+    session.add(upload)
+    try:
+        await session.commit()
+    except BaseException:
+        await run_in_threadpool(remove_upload_file, upload.id)
+        raise
+    await session.refresh(upload)
+    return upload
+
+async def get_upload(
+    session: AsyncSession,
+    upload_id: str,
+    user: User,
+) -> UploadSession:
+    query = select(UploadSession).filter(UploadSession.id == upload_id, UploadSession.user_id == user.id)
+    upload = (await session.execute(query)).scalar_one_or_none()
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Загрузка не найдена"
+        )
+    return upload
+
+async def get_received_chunks(
+    session: AsyncSession,
+    upload: UploadSession,
+) -> list[int]:
+    query = select(UploadChunk.index).filter(UploadChunk.upload_id == upload.id).order_by(UploadChunk.index)
+    return list((await session.execute(query)).scalars().all())
+
+async def write_chunk(
+    session: AsyncSession,
+    upload: UploadSession,
+    index: int,
+    request: Request,
+) -> None:
+    if upload.status != "open":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Загрузка уже завершается"
+        )
+    if not 0 <= index < chunks_total(upload):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный номер части"
+        )
+    upload_id = upload.id
+    offset = index * upload.chunk_size
+    expected = min(upload.chunk_size, upload.size - offset)
+    await session.rollback()
+
+    written = 0
+    fd = await run_in_threadpool(os.open, upload_path(upload_id), os.O_WRONLY)
+    try:
+        async for data in request.stream():
+            written += len(data)
+            if written > expected:
+                break
+            await run_in_threadpool(os.pwrite, fd, data, offset + written - len(data))
+    finally:
+        await run_in_threadpool(os.close, fd)
+    if written != expected:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Размер части должен быть {expected} байт"
+        )
+
+    await session.execute(
+        insert(UploadChunk).values(upload_id=upload_id, index=index).on_conflict_do_nothing()
+    )
+    await session.execute(
+        update(UploadSession).where(UploadSession.id == upload_id).values(updated_at=func.now())
+    )
+    await session.commit()
+
+async def complete_upload(
+    session: AsyncSession,
+    upload: UploadSession,
+) -> UploadSession:
+    query = select(func.count()).select_from(UploadChunk).filter(UploadChunk.upload_id == upload.id)
+    if (await session.execute(query)).scalar_one() != chunks_total(upload):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Загружены не все части"
+        )
+    if await __name_taken(session, upload.name):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Такое имя уже существует"
+        )
+    if upload_finalizer.full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис перегружен, повторите запрос позже",
+            headers={"Retry-After": "1"},
+        )
+    query = (
+        update(UploadSession)
+        .where(UploadSession.id == upload.id, UploadSession.status == "open")
+        .values(status="completing", updated_at=func.now())
+        .returning(UploadSession.id)
+    )
+    if (await session.execute(query)).first() is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Загрузка уже завершается"
+        )
+    await session.commit()
+    await session.refresh(upload)
+    upload_finalizer.submit(upload.id)
+    return upload
+
+async def get_completed_file(
+    session: AsyncSession,
+    upload: UploadSession,
+) -> AudioFile | None:
+    if upload.status != "done":
+        return None
+    query = select(AudioFile).filter(AudioFile.name == upload.name, AudioFile.user_id == upload.user_id)
+    return (await session.execute(query)).scalar_one_or_none()
+
+async def abort_upload(
+    session: AsyncSession,
+    upload: UploadSession,
+) -> None:
+    upload_id = upload.id
+    query = (
+        delete(UploadSession)
+        .where(UploadSession.id == upload_id)
+        .returning(UploadSession.user_id, UploadSession.size, UploadSession.status)
+    )
+    if (row := (await session.execute(query)).first()) is not None and row.status in RESERVED_STATUSES:
+        await refund_storage(session, row.user_id, row.size)
+    await session.commit()
+    await run_in_threadpool(remove_upload_file, upload_id)
+
+
+class UploadSessionCollector:
+    def __init__(self, ttl: float, interval: float) -> None:
+        self.ttl = ttl
+        self.interval = interval
+        self.collected = 0
+        self._task: asyncio.Task | None = None
+
+    def _remove_stale_files(self, active: set[str]) -> int:
+        removed = 0
+        deadline = time.time() - self.ttl
+        with os.scandir(settings.audio_uploads_path) as entries:
+            for entry in entries:
+                if entry.name in active:
+                    continue
+                try:
+                    if entry.stat().st_mtime < deadline:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    async def run_once(self) -> int:
+        async with new_session() as session:
+            expired_before = datetime.now(UTC) - timedelta(seconds=self.ttl)
+            query = (
+                delete(UploadSession)
+                .where(UploadSession.updated_at < expired_before)
+                .returning(UploadSession.id, UploadSession.user_id, UploadSession.size, UploadSession.status)
+            )
+            rows = (await session.execute(query)).all()
+            refunds: Counter[int] = Counter()
+            for row in rows:
+                if row.status in RESERVED_STATUSES:
+                    refunds[row.user_id] += row.size
+            for user_id, size in refunds.items():
+                await refund_storage(session, user_id, size)
+            await session.commit()
+            expired = [row.id for row in rows]
+            active = set((await session.execute(select(UploadSession.id))).scalars().all())
+        for upload_id in expired:
+            await run_in_threadpool(remove_upload_file, upload_id)
+        removed = len(expired) + await run_in_threadpool(self._remove_stale_files, active)
+        self.collected += removed
+        return removed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Не удалось удалить устаревшие загрузки")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class UploadFinalizer:
+    # Файл хешируется целиком, а не по частям: по sha256 всего содержимого
+    # загрузка по частям дедуплицируется с обычными загрузками. Хеширование
+    # большого файла долгое, поэтому выполняется в фоне, а клиент опрашивает
+    # состояние загрузки, пока она в статусе completing.
+    def __init__(self, workers: int, queue_size: int, interval: float) -> None:
+        self.workers = workers
+        self.queue_size = queue_size
+        self.interval = interval
+        self.completed = 0
+        self.failed = 0
+        self._queue: asyncio.Queue[str] | None = None
+        self._queued: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return len(self._queued)
+
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    async def _finalize(self, upload_id: str) -> None:
+        async with new_session() as session:
+            # Строка остается заблокированной, пока файл хешируется,
+            # так другой воркер не возьмется за ту же загрузку.
+            query = (
+                select(UploadSession)
+                .filter(UploadSession.id == upload_id, UploadSession.status == "completing")
+                .with_for_update(skip_locked=True)
+            )
+            upload = (await session.execute(query)).scalar_one_or_none()
+            if upload is None:
+                return
+            query = select(User).filter(User.id == upload.user_id)
+            user = (await session.execute(query)).scalar_one()
+            temp_path = upload_path(upload_id)
+            try:
+                with operation_duration_seconds.time("upload_hash"):
+                    checksum = await run_in_threadpool(_hash_file, temp_path, settings.upload_chunk_size)
+                await session.execute(
+                    update(UploadSession)
+                    .where(UploadSession.id == upload_id)
+                    .values(status="done", updated_at=func.now())
+                )
+                await create_audio_file(session, user, upload.name, temp_path, checksum, upload.size, reserved=True)
+            except Exception as e:
+                if not isinstance(e, HTTPException):
+                    logger.exception("Не удалось завершить загрузку %s", upload_id)
+                await session.rollback()
+                await run_in_threadpool(remove_upload_file, upload_id)
+                failed = update(UploadSession).values(
+                    status="failed",
+                    detail=e.detail if isinstance(e, HTTPException) else "Файл не удалось сохранить",
+                    updated_at=func.now(),
+                )
+                query = failed.where(UploadSession.id == upload_id, UploadSession.status == "completing")
+                if (await session.execute(query.returning(UploadSession.id))).first() is not None:
+                    await refund_storage(session, upload.user_id, upload.size)
+                else:
+                    # Файл успел создаться: резерв стал его платой и уже вернулся при удалении файла.
+                    await session.execute(failed.where(UploadSession.id == upload_id, UploadSession.status == "done"))
+                await session.commit()
+                self.failed += 1
+                return
+        self.completed += 1
+
+    async def _consume(self) -> None:
+        while True:
+            upload_id = await self._queue.get()
+            try:
+                await self._finalize(upload_id)
+            except Exception:
+                logger.exception("Не удалось завершить загрузку %s", upload_id)
+            finally:
+                self._queued.discard(upload_id)
+
+    def submit(self, upload_id: str) -> None:
+        if self._queue is None or upload_id in self._queued:
+            return
+        try:
+            self._queue.put_nowait(upload_id)
+        except asyncio.QueueFull:
+            # Загрузка останется в статусе completing и будет подобрана сверкой.
+            return
+        self._queued.add(upload_id)
+
+    async def resume(self) -> None:
+        async with new_session() as session:
+            query = (
+                select(UploadSession.id)
+                .filter(UploadSession.status == "completing")
+                .order_by(UploadSession.updated_at)
+                .limit(self.queue_size)
+            )
+            upload_ids = (await session.execute(query)).scalars().all()
+        for upload_id in upload_ids:
+            self.submit(upload_id)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.resume()
+            except Exception:
+                logger.exception("Не удалось загрузить незавершенные загрузки")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+            self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._run()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+
+
+upload_collector = UploadSessionCollector(
+    settings.upload_session_ttl,
+    settings.upload_session_gc_interval,
+)
+upload_finalizer = UploadFinalizer(
+    settings.upload_finalize_workers,
+    settings.upload_finalize_queue_size,
+    settings.upload_finalize_interval,
+)
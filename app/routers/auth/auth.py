@@ -5,10 +5,14 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from app.settings import settings
 from app.deps import http_client_dep, session_dep
+from app.ratelimit import rate_limited
 from app.routers.auth.schemas import AccessToken, Credentials
 from app.routers.auth.models import User
 from app.routers.auth.services import (
     get_auth_user_for_refresh,
+    get_current_refresh_token_payload,
+    revoke_refresh_token,
+    rotate_refresh_token,
     get_current_user,
     get_token,
     get_user_from_yandex,
@@ -26,7 +30,7 @@ router = APIRouter(
     tags=["auth"],
 )
 
-YANDEX_AUTHRIZE_URL = "https://oauth.yandex.ru/authorize?response_type=code&client_id={}&redirect_uri={}"
+YANDEX_AUTHRIZE_URL = settings.yandex.oauth_url + "/authorize?response_type=code&client_id={}&redirect_uri={}"
 
 @router.get(
     "/yandex",
@@ -75,6 +79,7 @@ async def yandex_callback(
 
 @router.post(
     "/set_credentials",
+    dependencies=[rate_limited("login")],
     summary="Устанавливаем пользователю данные для входы",
     status_code=status.HTTP_200_OK,
 )
@@ -96,6 +101,7 @@ async def set_credentials(
 
 @router.post(
     "/token",
+    dependencies=[rate_limited("login")],
     summary="Выпускаем access_token",
     response_model=AccessToken,
     status_code=status.HTTP_200_OK
@@ -116,8 +122,33 @@ async def login_for_access_token(
 @router.post(
     "/token/refresh",
     summary="Обновляем access_token",
+    description="Refresh_token одноразовый: в cookie возвращается новый, старый отзывается",
     response_model=AccessToken,
 )
-async def refresh_token(user: Annotated[User, Depends(get_auth_user_for_refresh)]):
+async def refresh_token(
+    session: session_dep,
+    payload: Annotated[dict, Depends(get_current_refresh_token_payload)],
+    user: Annotated[User, Depends(get_auth_user_for_refresh)],
+    response: Response,
+):
+    new_refresh_token = await rotate_refresh_token(session, payload, user)
     access_token = create_access_token(user.yandex_id, user.id)
-    return AccessToken(access_token=access_token)
\ No newline at end of file
+
+    response.set_cookie(key="refresh_token", value=new_refresh_token, httponly=True)
+    return AccessToken(access_token=access_token)
+
+@router.post(
+    "/logout",
+    summary="Выход из сессии",
+    description="Отзываем refresh_token из cookie",
+    status_code=status.HTTP_200_OK
+)
+async def logout(
+    session: session_dep,
+    payload: Annotated[dict, Depends(get_current_refresh_token_payload)],
+):
+    if payload.get("jti"):
+        await revoke_refresh_token(session, payload)
+    response = JSONResponse({"message": "Сессия завершена"})
+    response.delete_cookie(key="refresh_token", httponly=True)
+    return response
\ No newline at end of file
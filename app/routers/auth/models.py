@@ -1,4 +1,6 @@
-from sqlalchemy import String, Integer, Boolean
+from datetime import datetime
+
+from sqlalchemy import BigInteger, String, Integer, Boolean, DateTime, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db import Base
@@ -16,5 +18,18 @@ class User(Base):
     last_name: Mapped[str] = mapped_column(String(100), nullable=False)
     sex: Mapped[str] = mapped_column(String(20), nullable=False)
     is_admin: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    tokens_valid_after: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    storage_used: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    storage_quota: Mapped[int | None] = mapped_column(BigInteger)
 
     audio_files = relationship("AudioFile", back_populates="user", passive_deletes=True)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[str] = mapped_column(String(32), primary_key=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
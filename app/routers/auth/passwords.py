@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import bcrypt
+from fastapi import HTTPException, status
+
+from app.metrics import operation_duration_seconds
+from app.settings import settings
+
+
+T = TypeVar("T")
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _check(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class PasswordPool:
+    def __init__(self, kind: str, workers: int, queue_size: int) -> None:
+        self.kind = kind
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self.pending >= self.limit:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервис перегружен, повторите запрос позже",
+                headers={"Retry-After": "1"},
+            )
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(func, *args)
+        self.pending += 1
+        # Задача в пуле продолжает работать и после отмены ожидающего запроса,
+        # поэтому счетчик уменьшается только когда она действительно завершилась.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_pool = PasswordPool(
+    settings.password.pool,
+    settings.password.workers,
+    settings.password.queue_size,
+)
+
+
+async def hash_password(password: str) -> str:
+    with operation_duration_seconds.time("bcrypt_hash"):
+        hashed = await password_pool.run(_hash, password.encode(), settings.password.bcrypt_rounds)
+    return hashed.decode()
+
+async def check_password(password: str, hashed_password: str) -> bool:
+    with operation_duration_seconds.time("bcrypt_check"):
+        return await password_pool.run(_check, password.encode(), hashed_password.encode())
+
+def needs_rehash(hashed_password: str) -> bool:
+    try:
+        rounds = int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != settings.password.bcrypt_rounds
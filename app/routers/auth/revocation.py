@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import UTC, datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.deps import new_session
+from app.routers.auth.models import RevokedToken
+from app.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> list[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationIndex:
+    def __init__(self, capacity: int, error_rate: float, sync_interval: float, rebuild_interval: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.lookups = 0
+        self.db_checks = 0
+        self.listeners: list[Callable[[str], None]] = []
+        self._synced_at: datetime | None = None
+        self._rebuilt_at: datetime | None = None
+        self._task: asyncio.Task | None = None
+
+    async def rebuild(self) -> None:
+        async with new_session() as session:
+            await session.execute(delete(RevokedToken).where(RevokedToken.expires_at < func.now()))
+            await session.commit()
+            now = (await session.execute(select(func.now()))).scalar_one()
+            jtis = (await session.execute(select(RevokedToken.jti))).scalars().all()
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom = bloom
+        self._synced_at = now
+        self._rebuilt_at = datetime.now(UTC)
+
+    async def sync(self) -> None:
+        # revoked_at - время начала транзакции, которая могла закоммититься
+        # уже после прошлой синхронизации, поэтому окна перекрываются.
+        async with new_session() as session:
+            now = (await session.execute(select(func.now()))).scalar_one()
+            overlap = timedelta(seconds=2 * self.sync_interval)
+            query = select(RevokedToken.jti).where(RevokedToken.revoked_at >= self._synced_at - overlap)
+            jtis = (await session.execute(query)).scalars().all()
+        for jti in jtis:
+            if jti not in self.bloom:
+                self.bloom.add(jti)
+        self._synced_at = now
+
+    def add(self, jti: str) -> None:
+        self.bloom.add(jti)
+
+    async def revoke(self, session: AsyncSession, jti: str, expires_at: datetime) -> bool:
+        query = (
+            insert(RevokedToken)
+            .values(jti=jti, expires_at=expires_at)
+            .on_conflict_do_nothing()
+            .returning(RevokedToken.jti)
+        )
+        inserted = (await session.execute(query)).first() is not None
+        await session.commit()
+        self.add(jti)
+        for listener in self.listeners:
+            listener(jti)
+        return inserted
+
+    async def is_revoked(self, session: AsyncSession, jti: str) -> bool:
+        self.lookups += 1
+        if jti not in self.bloom:
+            return False
+        self.db_checks += 1
+        query = select(func.count()).select_from(RevokedToken).where(RevokedToken.jti == jti)
+        return (await session.execute(query)).scalar_one() > 0
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if self._rebuilt_at is None or (
+                    (datetime.now(UTC) - self._rebuilt_at).total_seconds() >= self.rebuild_interval
+                    or self.bloom.count > self.bloom.capacity
+                ):
+                    await self.rebuild()
+                else:
+                    await self.sync()
+            except Exception:
+                logger.exception("Не удалось обновить список отозванных токенов")
+
+    async def start(self) -> None:
+        if self._task is None:
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("Не удалось загрузить список отозванных токенов")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.bloom.count,
+            "capacity": self.bloom.capacity,
+            "lookups": self.lookups,
+            "db_checks": self.db_checks,
+        }
+
+
+revocation_index = RevocationIndex(
+    settings.revocation_bloom_capacity,
+    settings.revocation_bloom_error_rate,
+    settings.revocation_sync_interval,
+    settings.revocation_rebuild_interval,
+)
@@ -1,22 +1,35 @@
+import asyncio
+import hashlib
+import time
+import uuid
 from datetime import UTC, datetime, timedelta
-from typing import Annotated
+from types import MappingProxyType
+from typing import Annotated, Any, Mapping
 
-import bcrypt
 from fastapi import Cookie, Depends, HTTPException, status
-from httpx import AsyncClient
-from sqlalchemy import select
+from httpx import AsyncClient, Response, TransportError
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from jose import ExpiredSignatureError, jwt, JWTError
 
+from app.cache import TTLCache
 from app.deps import session_dep
+from app.metrics import operation_duration_seconds
 from app.settings import settings
 from app.routers.auth.schemas import Credentials, YandexUser, YandexToken
 from app.routers.auth.models import User
+from app.routers.auth.passwords import check_password, hash_password, needs_rehash
+from app.routers.auth.revocation import revocation_index
 
 
-YANDEX_TOKEN_URL = "https://oauth.yandex.ru/token"
-YANDEX_USERINFO_URL = "https://login.yandex.ru/info"
+YANDEX_TOKEN_URL = f"{settings.yandex.oauth_url}/token"
+YANDEX_USERINFO_URL = f"{settings.yandex.login_url}/info"
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+user_cache: TTLCache[str, dict] = TTLCache(settings.user_cache_size, settings.user_cache_ttl)
+token_cache: TTLCache[bytes, Mapping[str, Any]] = TTLCache(settings.token_cache_size, 0)
 
 def __get_data_for_token_request(code: str) -> dict:
     return {
@@ -26,6 +39,17 @@ def __get_data_for_token_request(code: str) -> dict:
         "client_secret": settings.yandex.client_secret,
     }
 
+async def __get_with_retries(http_client: AsyncClient, url: str, **kwargs) -> Response:
+    for attempt in range(settings.http_client.retries + 1):
+        try:
+            response = await http_client.get(url, **kwargs)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == settings.http_client.retries:
+                return response
+        except TransportError:
+            if attempt == settings.http_client.retries:
+                raise
+        await asyncio.sleep(settings.http_client.backoff * 2 ** attempt)
+
 async def get_token(code: str, http_client: AsyncClient) -> YandexToken:
     token_resp = await http_client.post(YANDEX_TOKEN_URL, data=__get_data_for_token_request(code))
     if token_resp.status_code != 200:
@@ -37,7 +61,7 @@ async def get_token(code: str, http_client: AsyncClient) -> YandexToken:
 
 async def get_user_from_yandex(token: YandexToken, http_client: AsyncClient) -> YandexUser:
     headers = {"Authorization": f"OAuth {token.access_token}"}
-    userinfo_resp = await http_client.get(YANDEX_USERINFO_URL, headers=headers)
+    userinfo_resp = await __get_with_retries(http_client, YANDEX_USERINFO_URL, headers=headers)
     if userinfo_resp.status_code != 200:
         raise HTTPException(
             status_code=userinfo_resp.status_code,
@@ -50,6 +74,22 @@ async def get_user_by_yandex_id(session: AsyncSession, yandex_user: YandexUser)
     result = await session.execute(query)
     return result.scalar_one_or_none()
 
+def __user_snapshot(user: User) -> dict:
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+async def get_user_by_sub(session: AsyncSession, sub: str) -> User | None:
+    if (cached := user_cache.get(sub)) is not None:
+        user = User(**cached)
+        make_transient_to_detached(user)
+        return await session.merge(user, load=False)
+
+    query = select(User).filter(User.yandex_id == sub)
+    result = await session.execute(query)
+    user = result.scalar_one_or_none()
+    if user:
+        user_cache.set(sub, __user_snapshot(user))
+    return user
+
 async def create_user_by_yandex_info(session: AsyncSession, yandex_user: YandexUser) -> User:
     new_user = User(**yandex_user.model_dump())
     session.add(new_user)
@@ -57,20 +97,62 @@ async def create_user_by_yandex_info(session: AsyncSession, yandex_user: YandexU
     await session.refresh(new_user)
     return new_user
 
-def __create_token(user_yandex_id: str, user_id: int, expires_delta: timedelta) -> str:
-    encode = {"sub": user_yandex_id, "id": user_id}
-    expires = datetime.now(UTC) + expires_delta
-    encode.update({"exp": expires})
+def __create_token(user_yandex_id: str, user_id: int, expires_delta: timedelta, **claims) -> str:
+    encode = {"sub": user_yandex_id, "id": user_id, **claims}
+    now = datetime.now(UTC)
+    # iat с долями секунды: токен, выданный сразу после отзыва сессий, не должен попасть под отзыв.
+    encode.update({"iat": now.timestamp(), "exp": now + expires_delta})
     return jwt.encode(encode, settings.secret_key, algorithm=settings.algorithm)
 
 def create_access_token(user_yandex_id: str, user_id: int) -> str:
     return __create_token(user_yandex_id, user_id, timedelta(minutes=20))
 
 def create_refresh_token(user_yandex_id: str, user_id: int) -> str:
-    return __create_token(user_yandex_id, user_id, timedelta(days=14))
+    return __create_token(user_yandex_id, user_id, timedelta(days=14), jti=uuid.uuid4().hex)
+
+def check_token_user(payload: dict, user: User) -> None:
+    if payload.get("id") != user.id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Токен не валиден")
+    if user.tokens_valid_after and payload.get("iat", 0) < user.tokens_valid_after.timestamp():
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Токен отозван")
+
+async def check_refresh_token_revoked(session: AsyncSession, payload: dict) -> None:
+    if not (jti := payload.get("jti")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Токен не валиден")
+    if await revocation_index.is_revoked(session, jti):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Токен отозван")
 
-def decode_token(token) -> dict:
-    return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+async def revoke_refresh_token(session: AsyncSession, payload: dict) -> bool:
+    expires_at = datetime.fromtimestamp(payload["exp"], UTC)
+    return await revocation_index.revoke(session, payload["jti"], expires_at)
+
+async def rotate_refresh_token(session: AsyncSession, payload: dict, user: User) -> str:
+    if not await revoke_refresh_token(session, payload):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Токен отозван")
+    return create_refresh_token(user.yandex_id, user.id)
+
+async def revoke_user_tokens(session: AsyncSession, user_id: int) -> bool:
+    valid_after = datetime.now(UTC)
+    query = (
+        update(User)
+        .where(User.id == user_id)
+        .values(tokens_valid_after=valid_after)
+        .returning(User.yandex_id)
+    )
+    yandex_id = (await session.execute(query)).scalar_one_or_none()
+    await session.commit()
+    if yandex_id is not None:
+        user_cache.invalidate(yandex_id)
+    return yandex_id is not None
+
+def __verify_token(token: str) -> tuple[Mapping[str, Any], float]:
+    payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    return MappingProxyType(payload), payload.get("exp", 0) - time.time()
+
+def decode_token(token) -> Mapping[str, Any]:
+    with operation_duration_seconds.time("jwt_decode"):
+        key = hashlib.sha256(token.encode()).digest()
+        return token_cache.get_or_compute(key, lambda: __verify_token(token))
 
 def is_token_expired(token: str) -> bool:
     try:
@@ -87,21 +169,16 @@ async def get_current_user(session: AsyncSession, token: str) -> User:
         user_yandex_id = payload.get("sub")
         if not user_yandex_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Ошибка валидации пользователя")
-        query = select(User).filter(User.yandex_id == user_yandex_id)
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
+        user = await get_user_by_sub(session, user_yandex_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не зарегестрирован")
+        check_token_user(payload, user)
+        if "jti" in payload:
+            await check_refresh_token_revoked(session, payload)
         return user
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный payload")
 
-def hash_password(password: str) -> bytes:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-
-def check_password(password: str, hashed_password: bytes) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed_password.encode())
-
 async def set_username_and_password(
     session: AsyncSession,
     credentials: Credentials,
@@ -109,8 +186,9 @@ async def set_username_and_password(
 ) -> None:
     try:
         current_user.username = credentials.username
-        current_user.hashed_password = hash_password(credentials.password)
+        current_user.hashed_password = await hash_password(credentials.password)
         await session.commit()
+        user_cache.invalidate(current_user.yandex_id)
     except IntegrityError:
         await session.rollback()
         raise HTTPException(
@@ -131,16 +209,20 @@ async def authenticate_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь не существует"
         )
-    if not check_password(password, user.hashed_password):
+    if not user.hashed_password or not await check_password(password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Имя пользователя или пароль неверны"
         )
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await hash_password(password)
+        await session.commit()
+        user_cache.invalidate(user.yandex_id)
     return user
 
 def get_current_refresh_token_payload(
     refresh_token: str = Cookie(None)
-) -> dict:
+) -> Mapping[str, Any]:
     if not refresh_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -170,11 +252,11 @@ async def get_auth_user_for_refresh(
             detail="Credentials не переданы"
         )
 
-    query = select(User).filter(User.yandex_id == sub)
-    result = await session.execute(query)
-    if not (user := result.scalar_one_or_none()):
+    if not (user := await get_user_by_sub(session, sub)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь не найден"
         )
+    check_token_user(refresh_token_payload, user)
+    await check_refresh_token_revoked(session, refresh_token_payload)
     return user
\ No newline at end of file
@@ -0,0 +1,139 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import PlainTextResponse
+
+from app.bus import invalidation_bus
+from app.deps import get_pool_status
+from app.metrics import CallbackCounter, CallbackGauge, registry
+from app.ratelimit import limiter
+from app.routers.admin.reaper import blob_reaper
+from app.routers.audio.processing import audio_processor
+from app.routers.audio.services import hot_file_cache, ownership_cache
+from app.routers.auth.passwords import password_pool
+from app.routers.auth.revocation import revocation_index
+from app.routers.auth.services import token_cache, user_cache
+from app.utils import verify_internal_token
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["internal"],
+    dependencies=[Depends(verify_internal_token)],
+)
+
+CACHES = (
+    ("user", user_cache),
+    ("token", token_cache),
+    ("ownership", ownership_cache),
+    ("hot_file", hot_file_cache),
+)
+COUNTER_STATS = {
+    "hits", "misses", "collapsed", "admitted", "rejected", "evicted",
+    "lookups", "db_checks", "published", "received", "reconnects",
+    "checkouts", "timeouts", "wait_seconds_total",
+}
+
+CallbackGauge(
+    "db_pool",
+    "Состояние пула соединений с базой",
+    lambda: {(key,): value for key, value in get_pool_status().items() if key not in COUNTER_STATS},
+    ("stat",),
+)
+CallbackCounter(
+    "db_pool_events_total",
+    "Выдачи соединений из пула, таймауты и суммарное время ожидания",
+    lambda: {(key,): value for key, value in get_pool_status().items() if key in COUNTER_STATS},
+    ("event",),
+)
+CallbackGauge(
+    "cache",
+    "Состояние in-process кэшей",
+    lambda: {
+        (cache_name, key): value
+        for cache_name, cache in CACHES
+        for key, value in cache.stats().items()
+        if key not in COUNTER_STATS
+    },
+    ("cache", "stat"),
+)
+CallbackCounter(
+    "cache_events_total",
+    "Попадания, промахи и вытеснения in-process кэшей",
+    lambda: {
+        (cache_name, key): value
+        for cache_name, cache in CACHES
+        for key, value in cache.stats().items()
+        if key in COUNTER_STATS
+    },
+    ("cache", "event"),
+)
+CallbackGauge(
+    "password_pool_pending",
+    "Операции bcrypt в пуле и в очереди",
+    lambda: {(): password_pool.pending},
+)
+CallbackCounter(
+    "blob_reaper_total",
+    "Счетчики фонового удаления файлов",
+    lambda: {("deleted",): blob_reaper.deleted, ("failed_attempts",): blob_reaper.failed},
+    ("stat",),
+)
+CallbackGauge(
+    "audio_processing",
+    "Аудиофайлы в очереди на обработку",
+    lambda: {("pending",): audio_processor.pending},
+    ("stat",),
+)
+CallbackCounter(
+    "audio_processing_total",
+    "Счетчики обработки загруженных аудиофайлов",
+    lambda: {("processed",): audio_processor.processed, ("failed",): audio_processor.failed},
+    ("stat",),
+)
+CallbackGauge(
+    "token_revocation",
+    "Состояние индекса отозванных refresh токенов",
+    lambda: {(key,): value for key, value in revocation_index.stats().items() if key not in COUNTER_STATS},
+    ("stat",),
+)
+CallbackCounter(
+    "token_revocation_checks_total",
+    "Проверки индекса отозванных refresh токенов",
+    lambda: {(key,): value for key, value in revocation_index.stats().items() if key in COUNTER_STATS},
+    ("stat",),
+)
+CallbackGauge(
+    "invalidation_bus",
+    "Состояние шины инвалидации кэшей между воркерами",
+    lambda: {(key,): value for key, value in invalidation_bus.stats().items() if key not in COUNTER_STATS},
+    ("stat",),
+)
+CallbackCounter(
+    "invalidation_bus_events_total",
+    "Сообщения и переподключения шины инвалидации",
+    lambda: {(key,): value for key, value in invalidation_bus.stats().items() if key in COUNTER_STATS},
+    ("event",),
+)
+CallbackGauge(
+    "rate_limit_in_flight",
+    "Запросы в обработке по классам ограничителя",
+    lambda: {(name,): route_class.in_flight for name, route_class in limiter.route_classes.items()},
+    ("route_class",),
+)
+
+@router.get(
+    "/db_pool",
+    summary="Состояние пула соединений с базой",
+    description="Эндпоинт для мониторинга, требует заголовок Authorization: Bearer APP_INTERNAL_TOKEN",
+    status_code=status.HTTP_200_OK
+)
+async def db_pool_status():
+    return get_pool_status()
+
+@router.get(
+    "/metrics",
+    summary="Метрики в формате Prometheus",
+    description="Эндпоинт для мониторинга, требует заголовок Authorization: Bearer APP_INTERNAL_TOKEN",
+    response_class=PlainTextResponse,
+    status_code=status.HTTP_200_OK
+)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
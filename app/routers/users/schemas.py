@@ -8,4 +8,9 @@ class UserUpdate(BaseModel):
 
     first_name: Optional[str] = None
     last_name: Optional[str] = None
-    sex: Optional[str] = None
\ No newline at end of file
+    sex: Optional[str] = None
+
+
+class StorageUsage(BaseModel):
+    used_bytes: int
+    quota_bytes: int
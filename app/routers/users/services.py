@@ -1,12 +1,23 @@
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.routers.auth.models import User
-from app.routers.users.schemas import UserUpdate
+from app.routers.auth.services import user_cache
+from app.routers.users.schemas import StorageUsage, UserUpdate
+from app.settings import settings
 
 async def update_user(session: AsyncSession, user: User, user_update: UserUpdate):
     data_to_update = user_update.model_dump(exclude_unset=True)
     for key, value in data_to_update.items():
         setattr(user, key, value)
     await session.commit()
+    user_cache.invalidate(user.yandex_id)
     await session.refresh(user)
-    return user
\ No newline at end of file
+    return user
+
+async def get_storage_usage(session: AsyncSession, user: User) -> StorageUsage:
+    query = select(
+        User.storage_used, func.coalesce(User.storage_quota, settings.user_storage_quota)
+    ).filter(User.id == user.id)
+    used, quota = (await session.execute(query)).one()
+    return StorageUsage(used_bytes=used, quota_bytes=quota)
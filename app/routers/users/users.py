@@ -2,15 +2,17 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, status
 
 from app.deps import session_dep
+from app.responses import FastJSONResponse, model_response
 from app.utils import get_current_auth_user
 from app.routers.auth.models import User
 from app.routers.auth.schemas import UserSchema
-from app.routers.users.schemas import UserUpdate
-from app.routers.users.services import update_user
+from app.routers.users.schemas import StorageUsage, UserUpdate
+from app.routers.users.services import get_storage_usage, update_user
 
 router = APIRouter(
     prefix="/users",
-    tags=["users"]
+    tags=["users"],
+    default_response_class=FastJSONResponse,
 )
 
 
@@ -21,7 +23,7 @@ router = APIRouter(
     status_code=status.HTTP_200_OK
 )
 async def get_auth_user_info(user: Annotated[User, Depends(get_current_auth_user)]):
-    return UserSchema.model_validate(user)
+    return model_response(UserSchema.model_validate(user))
 
 @router.patch(
     "/me",
@@ -38,4 +40,16 @@ async def update_user_info(
     session: session_dep,
 ):
     updated_user = await update_user(session, user, user_update)
-    return UserSchema.model_validate(updated_user)
\ No newline at end of file
+    return model_response(UserSchema.model_validate(updated_user))
+
+@router.get(
+    "/me/usage",
+    summary="Занятое место и квота хранилища",
+    response_model=StorageUsage,
+    status_code=status.HTTP_200_OK
+)
+async def get_auth_user_usage(
+    user: Annotated[User, Depends(get_current_auth_user)],
+    session: session_dep,
+):
+    return model_response(await get_storage_usage(session, user))
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -16,6 +17,12 @@ class PostgreSQLSettings(BaseSettings):
     password: str
     host: str
     port: str
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 100
 
     def get_conninfo(self):
         conninfo = (
@@ -32,6 +39,76 @@ class YandexSettings(BaseSettings):
     client_id: str
     client_secret: str
     redirect_uri: str
+    oauth_url: str = "https://oauth.yandex.ru"
+    login_url: str = "https://login.yandex.ru"
+
+
+class HTTPClientSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env', env_prefix="http_", env_file_encoding="utf-8", extra="ignore",
+    )
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    per_host_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 3.0
+    read_timeout: float = 10.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+    retries: int = 2
+    backoff: float = 0.2
+
+
+class StorageSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env', env_prefix="storage_", env_file_encoding="utf-8", extra="ignore",
+    )
+    backend: Literal["local", "object"] = "local"
+    layout: Literal["flat", "sharded"] = "sharded"
+    shard_depth: int = 2
+    shard_width: int = 2
+    bucket: str = "audio"
+
+
+class PasswordSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env', env_prefix="password_", env_file_encoding="utf-8", extra="ignore",
+    )
+    bcrypt_rounds: int = 12
+    pool: Literal["thread", "process"] = "thread"
+    workers: int = 4
+    queue_size: int = 64
+
+
+class RateLimitSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env', env_prefix="ratelimit_", env_file_encoding="utf-8", extra="ignore",
+    )
+    enabled: bool = True
+    store: Literal["memory", "postgres"] = "memory"
+    store_size: int = 100000
+    upload_rate: float = 2.0
+    upload_burst: float = 20.0
+    upload_bytes_rate: float = 32 * 1024 * 1024
+    upload_bytes_burst: float = 1024 * 1024 * 1024
+    upload_in_flight: int = 32
+    login_rate: float = 1.0
+    login_burst: float = 10.0
+    login_in_flight: int = 64
+    download_rate: float = 20.0
+    download_burst: float = 100.0
+    download_in_flight: int = 256
+
+
+class DownloadSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file='.env', env_prefix="download_", env_file_encoding="utf-8", extra="ignore",
+    )
+    chunk_size: int = 256 * 1024
+    sendfile: bool = True
+    mmap: bool = True
+    accel_redirect_prefix: str = ""
 
 
 class Settings(BaseSettings):
@@ -40,13 +117,79 @@ class Settings(BaseSettings):
     )
     secret_key: str
     algorithm: str
+    host: str = "0.0.0.0"
+    port: int = 80
+    workers: int = 1
+    internal_token: str = ""
+    invalidation_bus: bool = False
+    invalidation_channel: str = "cache_invalidation"
+    invalidation_reconnect_interval: float = 1.0
+    invalidation_heartbeat_interval: float = 10.0
+    invalidation_heartbeat_timeout: float = 5.0
     audio_storage_path: Path = BASE_DIR / "audio_storage"
+    audio_max_size: int = 512 * 1024 * 1024
+    upload_chunk_size: int = 1024 * 1024
+    list_default_limit: int = 100
+    list_max_limit: int = 1000
+    user_cache_size: int = 10000
+    user_cache_ttl: float = 60.0
+    token_cache_size: int = 10000
+    ownership_cache_size: int = 100000
+    ownership_cache_ttl: float = 300.0
+    hot_cache_max_bytes: int = 256 * 1024 * 1024
+    hot_cache_max_file_size: int = 8 * 1024 * 1024
+    hot_cache_sketch_width: int = 65536
+    reaper_batch_size: int = 500
+    reaper_interval: float = 30.0
+    reaper_max_attempts: int = 5
+    reconcile_batch_size: int = 1000
+    reconcile_workers: int = 8
+    reconcile_grace_period: float = 3600.0
+    reconcile_recheck_delay: float = 5.0
+    export_chunk_size: int = 1024 * 1024
+    user_storage_quota: int = 10 * 1024 * 1024 * 1024
+    revocation_bloom_capacity: int = 100000
+    revocation_bloom_error_rate: float = 0.001
+    revocation_sync_interval: float = 10.0
+    revocation_rebuild_interval: float = 60 * 60
+    batch_max_files: int = 100
+    batch_upload_concurrency: int = 4
+    upload_session_max_size: int = 16 * 1024 * 1024 * 1024
+    upload_session_chunk_size: int = 8 * 1024 * 1024
+    upload_session_ttl: float = 24 * 60 * 60
+    upload_session_gc_interval: float = 600.0
+    upload_finalize_workers: int = 2
+    upload_finalize_queue_size: int = 100
+    upload_finalize_interval: float = 60.0
+    processing_workers: int = 2
+    peaks_buckets: int = 2000
+    processing_queue_size: int = 1000
+    processing_batch_size: int = 500
+    processing_sweep_interval: float = 60.0
 
     postgresql: PostgreSQLSettings = PostgreSQLSettings()
     yandex: YandexSettings = YandexSettings()
+    http_client: HTTPClientSettings = HTTPClientSettings()
+    storage: StorageSettings = StorageSettings()
+    download: DownloadSettings = DownloadSettings()
+    password: PasswordSettings = PasswordSettings()
+    ratelimit: RateLimitSettings = RateLimitSettings()
+
+    @property
+    def worker_count(self) -> int:
+        return self.workers if self.workers > 0 else os.cpu_count() or 1
+
+    @property
+    def invalidation_bus_enabled(self) -> bool:
+        return self.invalidation_bus or self.worker_count > 1
+
+    @property
+    def audio_temp_path(self) -> Path:
+        return self.audio_storage_path / ".tmp"
 
+    @property
+    def audio_uploads_path(self) -> Path:
+        return self.audio_temp_path / "uploads"
 
-settings = Settings()
 
-if not os.path.isdir(settings.audio_storage_path):
-    os.mkdir(settings.audio_storage_path)
\ No newline at end of file
+settings = Settings()
\ No newline at end of file
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, NamedTuple
+from urllib.parse import quote, unquote
+
+import anyio
+from fastapi.concurrency import run_in_threadpool
+
+from app.settings import settings
+
+
+class StoredObject(NamedTuple):
+    size: int
+    mtime: float
+
+
+class StorageBackend(ABC):
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    @abstractmethod
+    def _path(self, key: str) -> Path:
+        ...
+
+    @abstractmethod
+    def location(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def _save(self, temp_path: str, key: str) -> None:
+        ...
+
+    def local_path(self, key: str) -> str:
+        return str(self._path(key))
+
+    def scan_dirs(self) -> list[str]:
+        return [str(self.root)]
+
+    def key_for(self, name: str) -> str:
+        return name
+
+    async def prepare(self) -> None:
+        await run_in_threadpool(os.makedirs, self.root, exist_ok=True)
+        await run_in_threadpool(os.makedirs, settings.audio_uploads_path, exist_ok=True)
+
+    async def save(self, temp_path: str, key: str) -> None:
+        await run_in_threadpool(self._save, temp_path, key)
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(os.path.exists, self._path(key))
+
+    async def stat(self, key: str) -> StoredObject:
+        stat_result = await run_in_threadpool(os.stat, self._path(key))
+        return StoredObject(stat_result.st_size, stat_result.st_mtime)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await run_in_threadpool(os.remove, self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _delete_many(self, keys: list[str]) -> list[str]:
+        failed = []
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                failed.append(key)
+        return failed
+
+    async def delete_many(self, keys: list[str]) -> list[str]:
+        return await run_in_threadpool(self._delete_many, keys)
+
+    async def iter_range(
+        self,
+        key: str,
+        start: int,
+        end: int,
+        chunk_size: int,
+    ) -> AsyncIterator[bytes]:
+        async with await anyio.open_file(self._path(key), mode="rb") as file:
+            await file.seek(start)
+            while start < end:
+                chunk = await file.read(min(chunk_size, end - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                yield chunk
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path, layout: str, shard_depth: int, shard_width: int) -> None:
+        super().__init__(root)
+        self.layout = layout
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+
+    def _shard(self, key: str) -> list[str]:
+        if self.layout == "flat":
+            return []
+        digest = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+        return [
+            digest[level * self.shard_width:(level + 1) * self.shard_width]
+            for level in range(self.shard_depth)
+        ]
+
+    def _path(self, key: str) -> Path:
+        return self.root.joinpath(*self._shard(key), key)
+
+    def location(self, key: str) -> str:
+        return str(self._path(key))
+
+    def scan_dirs(self) -> list[str]:
+        dirs = [str(self.root)]
+        for _ in range(self.shard_depth if self.layout == "sharded" else 0):
+            dirs = [
+                entry.path
+                for path in dirs
+                for entry in os.scandir(path)
+                if entry.is_dir(follow_symlinks=False) and not entry.name.startswith(".")
+            ]
+        return dirs
+
+    def _save(self, temp_path: str, key: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, path)
+
+
+class ObjectStorage(StorageBackend):
+    def __init__(self, root: Path, bucket: str) -> None:
+        super().__init__(root / bucket)
+        self.bucket = bucket
+
+    def _path(self, key: str) -> Path:
+        return self.root / quote(key, safe="")
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def key_for(self, name: str) -> str:
+        return unquote(name)
+
+    def _save(self, temp_path: str, key: str) -> None:
+        path = self._path(key)
+        # Ключи адресуются содержимым, поэтому уже сохраненный объект не перезаписывается.
+        if not path.exists():
+            fd, upload_path = tempfile.mkstemp(prefix=".upload-", dir=path.parent)
+            try:
+                with open(temp_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                    shutil.copyfileobj(src, dst, settings.upload_chunk_size)
+                os.replace(upload_path, path)
+            except BaseException:
+                try:
+                    os.remove(upload_path)
+                except FileNotFoundError:
+                    pass
+                raise
+        os.remove(temp_path)
+
+
+def create_storage() -> StorageBackend:
+    if settings.storage.backend == "object":
+        return ObjectStorage(settings.audio_storage_path, settings.storage.bucket)
+    return LocalStorage(
+        settings.audio_storage_path,
+        settings.storage.layout,
+        settings.storage.shard_depth,
+        settings.storage.shard_width,
+    )
+
+
+storage = create_storage()
@@ -1,13 +1,14 @@
+import secrets
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy import select
 from jose.exceptions import ExpiredSignatureError, JWTError
 
 from app.deps import session_dep
-from app.routers.auth.services import decode_token
+from app.routers.auth.services import check_token_user, decode_token, get_user_by_sub
 from app.routers.auth.models import User
+from app.settings import settings
 
 
 oauth2_scheme = OAuth2PasswordBearer(
@@ -41,13 +42,12 @@ async def get_current_auth_user(
             detail="Credentials не переданы"
         )
 
-    query = select(User).filter(User.yandex_id == sub)
-    result = await session.execute(query)
-    if not (user := result.scalar_one_or_none()):
+    if not (user := await get_user_by_sub(session, sub)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь не найден"
         )
+    check_token_user(payload, user)
     return user
 
 async def get_current_auth_admin(
@@ -58,4 +58,17 @@ async def get_current_auth_admin(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="У вас нет прав админа"
         )
-    return user
\ No newline at end of file
+    return user
+def verify_internal_token(
+    authorization: Annotated[str, Header()] = ""
+) -> None:
+    scheme, _, token = authorization.partition(" ")
+    if (
+        not settings.internal_token
+        or scheme.lower() != "bearer"
+        or not secrets.compare_digest(token.encode(), settings.internal_token.encode())
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступ запрещен"
+        )
@@ -0,0 +1,39 @@
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as file:
+        payload = json.load(file)
+    results = payload["results"]
+    return results.get("scenarios", results)
+
+
+def main(args: argparse.Namespace) -> int:
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    regressions = []
+    print(f"{'name':<32} {'metric':<15} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name in baseline.keys() & candidate.keys():
+        for metric, higher_is_better in (("throughput_rps", True), ("p95_ms", False), ("p99_ms", False)):
+            before, after = baseline[name][metric], candidate[name][metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            marker = " !" if worse > args.threshold else ""
+            print(f"{name:<32} {metric:<15} {before:>10.2f} {after:>10.2f} {change:>+8.1%}{marker}")
+            if worse > args.threshold:
+                regressions.append((name, metric))
+    if regressions:
+        print(f"Регрессии больше {args.threshold:.0%}: {len(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение двух прогонов бенчмарков")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Допустимое ухудшение, доля")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+
+from bench.stats import save_results, summarize
+
+
+DEFAULT_MIX = "me=30,list=15,download=20,refresh=10,login=10,upload=10,delete_user=5"
+
+
+@dataclass
+class BenchUser:
+    id: int
+    username: str
+    password: str
+    access_token: str
+    refresh_token: str
+    file_ids: list[int] = field(default_factory=list)
+    refresh_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(module: str, port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", module,
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        env=env,
+    )
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не поднялся за {timeout} секунд")
+
+
+async def oauth_login(client: httpx.AsyncClient, code: str) -> tuple[str, str]:
+    response = await client.get("/auth/yandex/callback", params={"code": code})
+    response.raise_for_status()
+    return response.json()["access_token"], response.cookies["refresh_token"]
+
+
+async def create_user(client: httpx.AsyncClient, index: int, files: int, file_size: int) -> BenchUser:
+    code = f"{index}-{uuid.uuid4().hex[:8]}"
+    access_token, refresh_token = await oauth_login(client, code)
+    username, password = f"bench-{code}", uuid.uuid4().hex
+    response = await client.post(
+        "/auth/set_credentials",
+        json={"username": username, "password": password},
+        headers={"Cookie": f"refresh_token={refresh_token}"},
+    )
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {access_token}"}
+    me = (await client.get("/users/me", headers=headers)).json()
+    user = BenchUser(me["id"], username, password, access_token, refresh_token)
+    for _ in range(files):
+        user.file_ids.append(await upload(client, user, file_size))
+    return user
+
+
+async def upload(client: httpx.AsyncClient, user: BenchUser, file_size: int) -> int:
+    response = await client.post(
+        "/audio/",
+        params={"file_name": uuid.uuid4().hex},
+        files={"file": ("bench.mp3", os.urandom(file_size), "audio/mpeg")},
+        headers=user.headers,
+    )
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+class Scenarios:
+    def __init__(self, client: httpx.AsyncClient, users: list[BenchUser], admin: BenchUser, file_size: int) -> None:
+        self.client = client
+        self.users = users
+        self.admin = admin
+        self.file_size = file_size
+
+    async def me(self, user: BenchUser) -> httpx.Response:
+        return await self.client.get("/users/me", headers=user.headers)
+
+    async def list(self, user: BenchUser) -> httpx.Response:
+        return await self.client.get("/audio/", params={"limit": 100}, headers=user.headers)
+
+    async def download(self, user: BenchUser) -> httpx.Response:
+        return await self.client.get(f"/audio/{random.choice(user.file_ids)}", headers=user.headers)
+
+    async def refresh(self, user: BenchUser) -> httpx.Response:
+        async with user.refresh_lock:
+            response = await self.client.post(
+                "/auth/token/refresh", headers={"Cookie": f"refresh_token={user.refresh_token}"}
+            )
+            if "refresh_token" in response.cookies:
+                user.refresh_token = response.cookies["refresh_token"]
+        return response
+
+    async def login(self, user: BenchUser) -> httpx.Response:
+        return await self.client.post(
+            "/auth/token", data={"username": user.username, "password": user.password}
+        )
+
+    async def upload(self, user: BenchUser) -> httpx.Response:
+        return await self.client.post(
+            "/audio/",
+            params={"file_name": uuid.uuid4().hex},
+            files={"file": ("bench.mp3", os.urandom(self.file_size), "audio/mpeg")},
+            headers=user.headers,
+        )
+
+    async def delete_user(self, user: BenchUser) -> httpx.Response:
+        access_token, _ = await oauth_login(self.client, f"victim-{uuid.uuid4().hex[:12]}")
+        victim = (await self.client.get("/users/me", headers={"Authorization": f"Bearer {access_token}"})).json()
+        return await self.client.delete(f"/admin/delete_user/{victim['id']}", headers=self.admin.headers)
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = int(weight)
+    return weights
+
+
+async def drive(args: argparse.Namespace, base_url: str) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        if args.recreate_tables:
+            (await client.get("/admin/create_table")).raise_for_status()
+
+        users = [await create_user(client, index, args.files_per_user, args.file_size) for index in range(args.users)]
+        admin = users[0]
+        (await client.post("/admin/make_admin", headers=admin.headers)).raise_for_status()
+
+        scenarios = Scenarios(client, users, admin, args.file_size)
+        weights = parse_mix(args.mix)
+        names, population = list(weights), list(weights.values())
+        latencies: dict[str, list[float]] = defaultdict(list)
+        errors: dict[str, int] = defaultdict(int)
+        deadline = time.monotonic() + args.duration
+
+        async def worker() -> None:
+            while time.monotonic() < deadline:
+                name = random.choices(names, population)[0]
+                user = random.choice(users)
+                started = time.perf_counter()
+                try:
+                    response = await getattr(scenarios, name)(user)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                elapsed = time.perf_counter() - started
+                if failed:
+                    errors[name] += 1
+                else:
+                    latencies[name].append(elapsed)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        duration = time.perf_counter() - started
+
+    results = {name: summarize(latencies[name], errors[name], duration) for name in names}
+    results["total"] = summarize(
+        [value for values in latencies.values() for value in values], sum(errors.values()), duration
+    )
+    return {
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "files_per_user": args.files_per_user,
+            "file_size": args.file_size,
+            "workers": args.workers,
+            "mix": weights,
+        },
+        "scenarios": results,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    processes = []
+    base_url = args.base_url
+    try:
+        if base_url is None:
+            mock_port, app_port = free_port(), free_port()
+            mock_url = f"http://127.0.0.1:{mock_port}"
+            env = {**os.environ, "YANDEX_OAUTH_URL": mock_url, "YANDEX_LOGIN_URL": mock_url}
+            if not args.rate_limit:
+                env["RATELIMIT_ENABLED"] = "false"
+            processes.append(start_server("bench.mock_oauth:app", mock_port, env))
+            processes.append(start_server("app.main:app", app_port, env, args.workers))
+            base_url = f"http://127.0.0.1:{app_port}"
+            await wait_ready(f"{mock_url}/docs")
+            await wait_ready(f"{base_url}/docs")
+
+        results = await drive(args, base_url)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print(f"{'scenario':<12} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, summary in results["scenarios"].items():
+        print(
+            f"{name:<12} {summary['throughput_rps']:>9.1f} {summary['p50_ms']:>9.2f} "
+            f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['errors']:>7}"
+        )
+    print(f"Результаты сохранены в {save_results('load', results, args.output)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест всех роутеров приложения")
+    parser.add_argument("--duration", type=float, default=30.0, help="Длительность прогона в секундах")
+    parser.add_argument("--concurrency", type=int, default=32, help="Количество параллельных клиентов")
+    parser.add_argument("--users", type=int, default=20, help="Количество пользователей")
+    parser.add_argument("--files-per-user", type=int, default=5, help="Файлов на пользователя перед прогоном")
+    parser.add_argument("--file-size", type=int, default=256 * 1024, help="Размер загружаемого файла в байтах")
+    parser.add_argument("--workers", type=int, default=1, help="Количество воркеров uvicorn")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Веса сценариев: name=weight,...")
+    parser.add_argument("--base-url", help="Гонять уже запущенное приложение вместо локального")
+    parser.add_argument(
+        "--rate-limit", action="store_true",
+        help="Не отключать ограничитель запросов в локально поднятом приложении",
+    )
+    parser.add_argument(
+        "--recreate-tables", action="store_true",
+        help="Пересоздать таблицы через /admin/create_table перед прогоном (удаляет все данные)",
+    )
+    parser.add_argument("--output", help="Путь к JSON с результатами")
+    asyncio.run(main(parser.parse_args()))
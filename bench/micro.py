@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import time
+from collections import namedtuple
+
+from bench.stats import save_results, summarize
+
+
+def measure(func, iterations: int) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+async def measure_async(func, iterations: int, concurrency: int) -> dict:
+    latencies = []
+
+    async def call() -> None:
+        call_started = time.perf_counter()
+        await func()
+        latencies.append(time.perf_counter() - call_started)
+
+    started = time.perf_counter()
+    for offset in range(0, iterations, concurrency):
+        await asyncio.gather(*(call() for _ in range(min(concurrency, iterations - offset))))
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+
+def main(args: argparse.Namespace) -> None:
+    from pydantic import TypeAdapter
+    from starlette.responses import JSONResponse
+
+    from app.responses import rows_response
+    from app.routers.audio.schemas import AudioSchema
+    from app.routers.auth.passwords import hash_password, password_pool
+    from app.routers.auth.services import create_access_token, decode_token, token_cache
+
+    token = create_access_token("bench", 1)
+    rows = [
+        AudioSchema(id=index, name=f"track-{index}.mp3", path=f"/audio/{index:064x}")
+        for index in range(args.rows)
+    ]
+
+    def decode_uncached() -> None:
+        token_cache.clear()
+        decode_token(token)
+
+    AudioRow = namedtuple("AudioRow", list(AudioSchema.model_fields))
+    db_rows = [AudioRow(row.name, row.id, row.path) for row in rows]
+    list_adapter = TypeAdapter(list[AudioSchema])
+
+    def serialize_rows() -> None:
+        [AudioSchema.model_validate(row).model_dump(mode="json") for row in rows]
+
+    def list_response_legacy() -> None:
+        models = [AudioSchema.model_validate(row) for row in db_rows]
+        JSONResponse(list_adapter.dump_python(list_adapter.validate_python(models), mode="json"))
+
+    def list_response_fast() -> None:
+        rows_response(db_rows)
+
+    results = {
+        "create_access_token": measure(lambda: create_access_token("bench", 1), args.iterations),
+        "decode_token_uncached": measure(decode_uncached, args.iterations),
+        "decode_token_cached": measure(lambda: decode_token(token), args.iterations),
+        f"audio_schema_serialize_{args.rows}": measure(serialize_rows, max(1, args.iterations // 1000)),
+        f"list_response_legacy_{args.rows}": measure(list_response_legacy, max(1, args.iterations // 1000)),
+        f"list_response_fast_{args.rows}": measure(list_response_fast, max(1, args.iterations // 1000)),
+    }
+    results["hash_password"] = asyncio.run(
+        measure_async(lambda: hash_password("bench-password"), args.hash_iterations, args.concurrency)
+    )
+    password_pool.shutdown()
+
+    print(f"{'benchmark':<32} {'ops/s':>10} {'p50 us':>10} {'p99 us':>10}")
+    for name, summary in results.items():
+        print(
+            f"{name:<32} {summary['throughput_rps']:>10.1f} "
+            f"{summary['p50_ms'] * 1000:>10.1f} {summary['p99_ms'] * 1000:>10.1f}"
+        )
+    legacy = results[f"list_response_legacy_{args.rows}"]["p50_ms"]
+    fast = results[f"list_response_fast_{args.rows}"]["p50_ms"]
+    print(f"Сериализация списка: экономия {(legacy - fast) * 10000 / args.rows:.2f} ms CPU на 10k строк")
+    print(f"Результаты сохранены в {save_results('micro', results, args.output)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--hash-iterations", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8, help="Параллельные вызовы hash_password")
+    parser.add_argument("--rows", type=int, default=10000, help="Строк в бенчмарке сериализации")
+    parser.add_argument("--output", help="Путь к JSON с результатами")
+    main(parser.parse_args())
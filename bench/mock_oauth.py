@@ -0,0 +1,27 @@
+from fastapi import FastAPI, Form, Header, HTTPException, status
+
+app = FastAPI()
+
+
+@app.post("/token")
+async def token(code: str = Form(...)):
+    return {
+        "token_type": "bearer",
+        "access_token": f"token-{code}",
+        "expires_in": 3600,
+        "refresh_token": f"refresh-{code}",
+    }
+
+
+@app.get("/info")
+async def info(authorization: str = Header(...)):
+    if not authorization.startswith("OAuth token-"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    code = authorization.removeprefix("OAuth token-")
+    return {
+        "id": f"bench-{code}",
+        "default_email": f"bench-{code}@example.com",
+        "first_name": "Bench",
+        "last_name": code,
+        "sex": "male",
+    }
@@ -0,0 +1,26 @@
+import os
+import tempfile
+import unittest
+
+from app.routers.audio.analysis import analyze
+
+
+class AnalyzeTest(unittest.TestCase):
+    def analyze_bytes(self, data: bytes) -> tuple[dict, bytes]:
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        return analyze(path, 10)
+
+    def test_short_files_have_empty_metadata(self) -> None:
+        for data in (b"", b"\xff"):
+            with self.subTest(data=data):
+                metadata, peaks = self.analyze_bytes(data)
+                self.assertIsNone(metadata["codec"])
+                self.assertIsNone(metadata["duration"])
+                self.assertEqual(peaks, b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
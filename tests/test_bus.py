@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+import asyncpg
+
+from app.bus import InvalidationBus
+from app.cache import TTLCache
+from app.settings import settings
+
+
+class InvalidationBusTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        try:
+            connection = await asyncpg.connect(
+                host=settings.postgresql.host,
+                port=int(settings.postgresql.port),
+                user=settings.postgresql.user,
+                password=settings.postgresql.password,
+                database=settings.postgresql.dbname,
+                timeout=2,
+            )
+        except (OSError, asyncpg.PostgresError, TimeoutError):
+            self.skipTest("Postgres недоступен")
+        await connection.close()
+
+        self.buses = [InvalidationBus("test_bus", 0.1, 0.2, 1.0) for _ in range(2)]
+        self.caches = [TTLCache(10, 60) for _ in self.buses]
+        for bus, cache in zip(self.buses, self.caches):
+            bus.register_cache("user", cache)
+            await bus.start()
+            self.addAsyncCleanup(bus.stop)
+
+    async def wait_for(self, condition) -> None:
+        for _ in range(50):
+            if condition():
+                return
+            await asyncio.sleep(0.02)
+        self.fail("Сообщение шины не дошло")
+
+    async def test_invalidate_discards_key_in_other_worker(self) -> None:
+        first, second = self.caches
+        first.set("user", 1)
+        second.set("user", 1)
+        second.set((1, 2), 2)
+
+        first.invalidate("user")
+        self.buses[0].publish("user", (1, 2))
+        await self.wait_for(lambda: self.buses[1].received == 2)
+
+        self.assertIsNone(second.get("user"))
+        self.assertIsNone(second.get((1, 2)))
+        self.assertEqual(self.buses[0].received, 0)
+
+    async def test_single_leader_and_takeover(self) -> None:
+        self.assertEqual(sorted(bus.is_leader for bus in self.buses), [False, True])
+        leader, follower = sorted(self.buses, key=lambda bus: not bus.is_leader)
+        acquired = []
+        follower.leadership_listeners.append(acquired.append)
+
+        await leader.stop()
+        await self.wait_for(lambda: follower.is_leader)
+        self.assertEqual(acquired, [True])
+
+    async def test_reconnect_resets_caches(self) -> None:
+        bus, cache = self.buses[1], self.caches[1]
+        cache.set("user", 1)
+        bus._connection.terminate()
+        await self.wait_for(lambda: bus.reconnects == 1 and bus.stats()["connected"])
+        self.assertIsNone(cache.get("user"))
+
+
+if __name__ == "__main__":
+    unittest.main()
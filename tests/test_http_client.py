@@ -0,0 +1,90 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+import uvicorn
+
+from app.deps import create_http_client
+from app.routers.auth import services
+from app.settings import settings
+from bench.mock_oauth import app as mock_oauth_app
+
+
+class MockOAuthServer:
+    def __init__(self) -> None:
+        self.client_ports: set[int] = set()
+        self.requests = 0
+        self.failures_left = 0
+        self._socket = socket.socket()
+        self._socket.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self._socket.getsockname()[1]}"
+        self._server = uvicorn.Server(uvicorn.Config(self, log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    async def __call__(self, scope, receive, send) -> None:
+        self.client_ports.add(scope["client"][1])
+        self.requests += 1
+        if scope["path"] == "/slow":
+            await asyncio.sleep(1)
+        elif scope["path"] == "/info" and self.failures_left:
+            self.failures_left -= 1
+            await send({"type": "http.response.start", "status": 503, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await mock_oauth_app(scope, receive, send)
+
+    def __enter__(self) -> "MockOAuthServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+
+class HTTPClientTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.server = MockOAuthServer().__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        for patcher in (
+            mock.patch.object(settings.yandex, "oauth_url", self.server.url),
+            mock.patch.object(settings.yandex, "login_url", self.server.url),
+            mock.patch.object(settings.http_client, "read_timeout", 0.2),
+            mock.patch.object(settings.http_client, "backoff", 0.01),
+            mock.patch.object(services, "YANDEX_TOKEN_URL", f"{self.server.url}/token"),
+            mock.patch.object(services, "YANDEX_USERINFO_URL", f"{self.server.url}/info"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_oauth_flow_reuses_pooled_connection(self) -> None:
+        async with create_http_client() as client:
+            for index in range(5):
+                token = await services.get_token(f"code{index}", client)
+                yandex_user = await services.get_user_from_yandex(token, client)
+                self.assertEqual(yandex_user.yandex_id, f"bench-code{index}")
+        self.assertEqual(self.server.requests, 10)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    async def test_userinfo_retries_on_unavailable(self) -> None:
+        self.server.failures_left = settings.http_client.retries
+        async with create_http_client() as client:
+            token = await services.get_token("retry", client)
+            yandex_user = await services.get_user_from_yandex(token, client)
+        self.assertEqual(yandex_user.yandex_id, "bench-retry")
+        self.assertEqual(self.server.requests, 2 + settings.http_client.retries)
+
+    async def test_read_timeout(self) -> None:
+        async with create_http_client() as client:
+            with self.assertRaises(httpx.ReadTimeout):
+                await client.get(f"{self.server.url}/slow")
+
+
+if __name__ == "__main__":
+    unittest.main()